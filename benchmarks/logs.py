@@ -0,0 +1,173 @@
+# Copyright (c) 2020-present, Carberra
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Benchmarks for the cost of logging on the event loop.
+
+Run with `python -m benchmarks.logs` (or `nox -s benchmarks -- logs`)
+from the project root. Each scenario logs from a coroutine and times
+every call, which is the time the event loop spends blocked. The legacy
+pipeline (synchronous handlers that build a formatter per record) is
+measured alongside the queued one for comparison.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import io
+import logging
+import os
+import statistics
+import time
+import typing as t
+
+from carberretta.utils import logs
+
+FMT: t.Final = "{asctime} [ {levelname[0]} ] {name}: {message}"
+SQL: t.Final = "INSERT OR IGNORE INTO unhoist_queue VALUES (?, ?)"
+
+
+class LegacyFormatter(logging.Formatter):
+    # What configure_logging used to do for every record.
+    def format(self, record: logging.LogRecord) -> str:
+        return logging.Formatter(f"\33[1m{FMT}\33[0m", style="{").format(record)
+
+
+def legacy_pipeline(
+    devnull: t.TextIO,
+) -> tuple[list[logging.Handler], t.Callable[[], None]]:
+    console = logging.StreamHandler(devnull)
+    console.setFormatter(LegacyFormatter())
+    console.setLevel(logging.INFO)
+    buffer = logging.StreamHandler(io.StringIO())
+    buffer.setFormatter(LegacyFormatter())
+    return [console, buffer], lambda: None
+
+
+def queued_pipeline(
+    devnull: t.TextIO, size: int
+) -> tuple[list[logging.Handler], t.Callable[[], None]]:
+    console = logging.StreamHandler(devnull)
+    console.setFormatter(logs.LevelFormatter(FMT, {logging.INFO: f"\33[1m{FMT}"}))
+    console.setLevel(logging.INFO)
+    store = logs.LogStoreHandler(logs.LogStore())
+    store.setFormatter(logs.LevelFormatter(FMT))
+    handler = logs.BoundedQueueHandler(size)
+    listener = logs.BoundedQueueListener(
+        handler.queue, console, store, respect_handler_level=True
+    )
+    listener.start()
+
+    def stop() -> None:
+        listener.stop()
+        if dropped := sum(handler.dropped.values()):
+            print(f"  ({dropped:,} records dropped)")
+
+    return [handler], stop
+
+
+def scenarios(log: logging.Logger) -> dict[str, t.Callable[[int], None]]:
+    def plain(i: int) -> None:
+        log.info(f"Unhoisted {i:,} nicknames")
+
+    def args(i: int) -> None:
+        log.info("Shard %d heartbeat latency %.2f ms", i % 4, i / 7)
+
+    def sql(i: int) -> None:
+        log.debug(f"Executing query: {SQL} with args (695021594430668882, {i})")
+
+    def error(i: int) -> None:
+        try:
+            raise ValueError(i)
+        except ValueError:
+            log.exception("Something went wrong")
+
+    return {"f-string": plain, "%-args": args, "debug sql": sql, "exception": error}
+
+
+async def run(records: int, func: t.Callable[[int], None]) -> list[float]:
+    samples = []
+
+    for i in range(records):
+        start = time.perf_counter()
+        func(i)
+        samples.append(time.perf_counter() - start)
+
+        # Yield now and then, like a real bot between events.
+        if not i % 100:
+            await asyncio.sleep(0)
+
+    return samples
+
+
+def bench(label: str, records: int, size: int) -> None:
+    log = logging.getLogger(f"benchmarks.logs.{label}")
+    log.setLevel(logging.DEBUG)
+    log.propagate = False
+
+    with open(os.devnull, "w") as devnull:
+        for name, func in scenarios(log).items():
+            if label == "legacy":
+                handlers, stop = legacy_pipeline(devnull)
+            else:
+                handlers, stop = queued_pipeline(devnull, size)
+
+            for handler in handlers:
+                log.addHandler(handler)
+
+            samples = asyncio.run(run(records, func))
+
+            for handler in handlers:
+                log.removeHandler(handler)
+
+            cuts = statistics.quantiles(samples, n=100, method="inclusive")
+            print(
+                f"{label:<8} {name:<10} {sum(samples) * 1e3:>9.1f} "
+                f"{cuts[49] * 1e6:>8.2f} {cuts[98] * 1e6:>8.2f} "
+                f"{max(samples) * 1e6:>9.1f}"
+            )
+            stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--records", type=int, default=20_000)
+    parser.add_argument("--queue-size", type=int, default=logs.QUEUE_SIZE)
+    args = parser.parse_args()
+
+    print(
+        f"{'pipeline':<8} {'scenario':<10} {'total ms':>9} {'p50 us':>8} "
+        f"{'p99 us':>8} {'max us':>9}"
+    )
+
+    for label in ("legacy", "queued"):
+        bench(label, args.records, args.queue_size)
+
+
+if __name__ == "__main__":
+    main()
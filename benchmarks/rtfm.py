@@ -0,0 +1,208 @@
+# Copyright (c) 2020-present, Carberra
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Offline benchmarks for the RTFM extension.
+
+Run with `python -m benchmarks.rtfm` (or `nox -s benchmarks`) from the
+project root. Synthetic inventories are generated on the fly, and any
+inventories in `benchmarks/fixtures` are benchmarked alongside them.
+No recorded inventory ships with the repo yet; use `--record URL
+--name NAME` to download one into the fixtures, after which the suite
+still runs offline.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import random
+import statistics
+import time
+import tracemalloc
+import typing as t
+import urllib.request
+import zlib
+from pathlib import Path
+
+from carberretta.extensions import rtfm
+
+FIXTURES_DIR: t.Final = Path(__file__).parent / "fixtures"
+SYNTHETIC_SIZES: t.Final = (1_000, 10_000, 100_000)
+# fmt: off
+WORDS: t.Final = (
+    "app", "attachment", "bot", "bucket", "cache", "channel", "client", "command",
+    "component", "context", "embed", "emoji", "entity", "event", "factory", "fetch",
+    "gateway", "guild", "interaction", "invite", "manager", "member", "message",
+    "option", "permission", "plugin", "presence", "reaction", "rest", "role",
+    "session", "shard", "snowflake", "sticker", "stream", "template", "thread",
+    "user", "voice", "webhook",
+)
+ROLES: t.Final = (
+    "py:module", "py:class", "py:method", "py:function", "py:attribute",
+    "py:property", "py:data", "py:exception", "std:label", "std:doc",
+)
+# fmt: on
+
+
+def _header(project: str, version: str) -> bytes:
+    return (
+        "# Sphinx inventory version 2\n"
+        f"# Project: {project}\n"
+        f"# Version: {version}\n"
+        "# The remainder of this file is compressed using zlib.\n"
+    ).encode("utf-8")
+
+
+def make_inventory(size: int, *, seed: int = 0) -> bytes:
+    rng = random.Random(seed)  # nosec B311
+    lines = []
+
+    for i in range(size):
+        parts = [rng.choice(WORDS) for _ in range(rng.randint(1, 4))]
+        name = f"synthetic.{'.'.join(parts)}_{i}"
+        page = "/".join(parts[:-1]) or "index"
+        lines.append(f"{name} {rng.choice(ROLES)} 1 reference/{page}/#$ -")
+
+    body = ("\n".join(lines) + "\n").encode("utf-8")
+    return _header("synthetic", "1.0") + zlib.compress(body, 9)
+
+
+def record_url(url: str, name: str) -> Path:
+    path = FIXTURES_DIR / f"{name}.inv"
+    FIXTURES_DIR.mkdir(exist_ok=True)
+
+    with urllib.request.urlopen(url) as resp:  # nosec B310
+        path.write_bytes(resp.read())
+
+    return path
+
+
+def make_queries(names: list[str], count: int, *, seed: int = 0) -> list[str]:
+    # Autocomplete sees every keystroke, so the corpus is made of the
+    # prefixes and trailing fragments of real names.
+    rng = random.Random(seed)  # nosec B311
+    queries: list[str] = []
+
+    while len(queries) < count:
+        name = rng.choice(names)
+        cut = rng.randint(1, len(name))
+        queries.append(name[:cut] if rng.random() < 0.7 else name[-cut:])
+
+    return queries
+
+
+def _timed(func: t.Callable[[], t.Any], repeat: int) -> float:
+    best = float("inf")
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+
+    return best
+
+
+def _percentiles(samples: list[float]) -> tuple[float, float]:
+    cuts = statistics.quantiles(samples, n=100, method="inclusive")
+    return cuts[49], cuts[98]
+
+
+def bench_inventory(label: str, stream: bytes, queries: int, repeat: int) -> None:
+    decode = _timed(lambda: rtfm.decode_object_inv(stream), repeat)
+    cache = rtfm.decode_object_inv(stream)
+
+    tracemalloc.start()
+    packed = rtfm.MappedInventory.pack(rtfm.decode_object_inv(stream), None)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    load = _timed(lambda: rtfm.MappedInventory(packed), repeat)
+    inventory = rtfm.Inventory(label, "https://example.invalid/")
+    inventory.data = rtfm.MappedInventory(packed)
+    corpus = make_queries(inventory.index.names, queries)
+
+    async def _run() -> tuple[list[float], list[float]]:
+        search: list[float] = []
+        embed: list[float] = []
+
+        # The render cache is cleared before every sample so these are
+        # the cold paths a previously unseen query takes.
+        for query in corpus:
+            rtfm._render.cache_clear()
+            start = time.perf_counter()
+            await rtfm.get_rtfm(query, inventory)
+            search.append(time.perf_counter() - start)
+
+            rtfm._render.cache_clear()
+            start = time.perf_counter()
+            await rtfm.build_rtfm_output(query, inventory)
+            embed.append(time.perf_counter() - start)
+
+        return search, embed
+
+    search, embed = asyncio.run(_run())
+    search_p50, search_p99 = _percentiles(search)
+    embed_p50, embed_p99 = _percentiles(embed)
+
+    print(
+        f"{label:<28} {len(cache):>8,} {len(cache) / decode:>12,.0f} "
+        f"{len(stream) / decode / 2**20:>8.2f} {peak / 2**20:>8.2f} "
+        f"{load * 1e3:>8.2f} {search_p50 * 1e3:>7.3f} {search_p99 * 1e3:>7.3f} "
+        f"{embed_p50 * 1e3:>7.3f} {embed_p99 * 1e3:>7.3f}"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="*", default=SYNTHETIC_SIZES)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--record", metavar="URL")
+    parser.add_argument("--name", help="The fixture name to record a URL as.")
+    args = parser.parse_args()
+
+    if args.record:
+        print(f"Recorded {record_url(args.record, args.name or 'recorded')}")
+        return
+
+    print(
+        f"{'inventory':<28} {'entries':>8} {'entries/s':>12} {'MiB/s':>8} "
+        f"{'peak MiB':>8} {'load ms':>8} {'ac p50':>7} {'ac p99':>7} "
+        f"{'emb p50':>7} {'emb p99':>7}"
+    )
+
+    for size in args.sizes:
+        stream = make_inventory(size, seed=size)
+        bench_inventory(f"synthetic-{size}", stream, args.queries, args.repeat)
+
+    for path in sorted(FIXTURES_DIR.glob("*.inv")):
+        bench_inventory(path.stem, path.read_bytes(), args.queries, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
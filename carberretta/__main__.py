@@ -30,5 +30,7 @@ from carberretta import bot
 from carberretta.utils import helpers
 
 if __name__ == "__main__":
-    bot.bot.d.logs = helpers.configure_logging()
+    bot.bot.d.logs, bot.bot.d.log_archive = helpers.configure_logging(
+        archive_path=bot.bot.d._dynamic / "logs"
+    )
     bot.run()
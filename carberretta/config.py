@@ -41,7 +41,8 @@ class ConfigMeta(type):
             "str": str,
             "int": int,
             "float": float,
-            "bool": bool,
+            # bool("0") and bool("false") are both truthy.
+            "bool": lambda x: x.strip().lower() in ("1", "true", "yes", "on"),
             "set": lambda x: set([cls.resolve_value(e.strip()) for e in x.split(",")]),
             "file": lambda x: Path(x).read_text().strip("\n"),
         }
@@ -63,6 +64,12 @@ class ConfigMeta(type):
     def __getitem__(cls, name: str) -> t.Any:
         return cls.__getattr__(name)
 
+    def get(cls, name: str, default: t.Any = None) -> t.Any:
+        try:
+            return cls.resolve_key(name)
+        except KeyError:
+            return default
+
 
 class Config(metaclass=ConfigMeta):
     pass
@@ -28,73 +28,508 @@
 
 from __future__ import annotations
 
-import datetime as dt
+import asyncio
+import collections
 import logging
+import math
+import time
+import typing as t
+from dataclasses import dataclass, field
 
 import hikari
 import lightbulb
+from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
 
 from carberretta import Config
-from carberretta.utils import chron
+from carberretta.utils import chron, helpers, string
 
 TIMEOUT = 600
-
-plugin = lightbulb.Plugin("Gateway")
+# A wheel of 1,024 one-second slots covers TIMEOUT in a single rotation.
+WHEEL_RESOLUTION: t.Final = 1.0
+WHEEL_SIZE: t.Final = 1_024
+# hikari already queues requests per rate limit bucket; the pool just
+# stops a join wave from parking thousands of coroutines on them.
+ACTION_WORKERS: t.Final = Config.get("GATEWAY_ACTION_WORKERS", 4)
+ACTION_RETRIES: t.Final = 3
+# A burst starts once this many joins land inside the window, and ends
+# when the window holds fewer than half as many.
+BURST_THRESHOLD: t.Final = Config.get("GATEWAY_BURST_THRESHOLD", 10)
+BURST_WINDOW: t.Final = Config.get("GATEWAY_BURST_WINDOW", 30)
+BURST_INTERVAL: t.Final = Config.get("GATEWAY_BURST_INTERVAL", 30)
+BURST_TICK: t.Final = 5.0
+MESSAGE_BUDGET: t.Final = 1_800
+
+plugin = lightbulb.Plugin("Gateway", include_datastore=True)
 
 log = logging.getLogger(__name__)
 
 
-async def schedule_action(member: hikari.Member, secs: int = TIMEOUT) -> None:
-    async def _take_action(member_id: int) -> None:
-        if not (member := plugin.bot.cache.get_member(Config.GUILD_ID, member_id)):
-            return
+class TimerWheel:
+    __slots__ = ("resolution", "slots", "where", "tick")
 
-        if member.is_pending:
-            log.info(
-                f"Member '{member.display_name}' kicked for not accepting "
-                "the guidelines"
-            )
-            return await member.kick(
-                reason="Member failed to accept the guidelines before being timed out."
+    # Deadlines hash into a ring of slots by the tick they fall due on.
+    # Scheduling and cancelling are both a dict operation, and each tick
+    # only looks at the one slot it lands on.
+    def __init__(self, size: int, resolution: float) -> None:
+        self.resolution = resolution
+        self.slots: list[dict[int, int]] = [{} for _ in range(size)]
+        self.where: dict[int, int] = {}
+        self.tick = self._tick_at(time.monotonic())
+
+    def __len__(self) -> int:
+        return len(self.where)
+
+    def __contains__(self, key: int) -> bool:
+        return key in self.where
+
+    def _tick_at(self, when: float) -> int:
+        return math.floor(when / self.resolution)
+
+    def schedule(self, key: int, delay: float) -> None:
+        self.cancel(key)
+        # Round up so nothing ever fires early.
+        due = max(
+            math.ceil((time.monotonic() + delay) / self.resolution), self.tick + 1
+        )
+        slot = due % len(self.slots)
+        self.slots[slot][key] = due
+        self.where[key] = slot
+
+    def cancel(self, key: int) -> bool:
+        if (slot := self.where.pop(key, None)) is None:
+            return False
+
+        del self.slots[slot][key]
+        return True
+
+    def advance(self, now: float) -> list[int]:
+        target = self._tick_at(now)
+        # After a long stall every slot needs a look, but only once.
+        start = max(self.tick + 1, target - len(self.slots) + 1)
+        due = []
+
+        for tick in range(start, target + 1):
+            slot = self.slots[tick % len(self.slots)]
+            # Entries from later rotations share the slot, so check.
+            for key in [k for k, v in slot.items() if v <= target]:
+                del slot[key]
+                del self.where[key]
+                due.append(key)
+
+        self.tick = max(self.tick, target)
+        return due
+
+
+class BurstDetector:
+    __slots__ = ("window", "threshold", "joins", "started_at", "burst_joins", "peak")
+
+    def __init__(self, window: float, threshold: int) -> None:
+        self.window = window
+        self.threshold = threshold
+        self.joins: collections.deque[float] = collections.deque()
+        self.started_at: float | None = None
+        self.burst_joins = 0
+        self.peak = 0
+
+    @property
+    def active(self) -> bool:
+        return self.started_at is not None
+
+    def _trim(self, now: float) -> None:
+        while self.joins and self.joins[0] <= now - self.window:
+            self.joins.popleft()
+
+    def record(self, now: float) -> bool:
+        self.joins.append(now)
+        self._trim(now)
+
+        if self.started_at is not None:
+            self.burst_joins += 1
+            self.peak = max(self.peak, len(self.joins))
+            return False
+
+        if len(self.joins) < self.threshold:
+            return False
+
+        self.started_at = now
+        self.burst_joins = self.peak = len(self.joins)
+        return True
+
+    def settle(self, now: float) -> tuple[float, int, int] | None:
+        self._trim(now)
+
+        if self.started_at is None or len(self.joins) * 2 >= self.threshold:
+            return None
+
+        stats = (now - self.started_at, self.burst_joins, self.peak)
+        self.started_at = None
+        return stats
+
+
+@dataclass(slots=True)
+class Action:
+    member_id: int
+    queued_at: float
+    kick: bool = False
+    roles: set[int] = field(default_factory=set)
+
+
+class ActionQueue:
+    __slots__ = ("pending", "queue", "tasks", "done", "total_latency", "max_latency")
+
+    # Actions are keyed by member, so every role grant for a member that
+    # is still waiting merges into one edit, and a kick replaces them.
+    def __init__(self) -> None:
+        self.pending: dict[int, Action] = {}
+        self.queue: asyncio.Queue[int] = asyncio.Queue()
+        self.tasks: list[asyncio.Task[None]] = []
+        self.done = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def __len__(self) -> int:
+        return len(self.pending)
+
+    def _action(self, member_id: int) -> Action:
+        if (action := self.pending.get(member_id)) is None:
+            action = self.pending[member_id] = Action(member_id, time.monotonic())
+            self.queue.put_nowait(member_id)
+
+        return action
+
+    def grant(self, member_id: int, roles: set[int]) -> None:
+        self._action(member_id).roles |= roles
+
+    def kick(self, member_id: int) -> None:
+        self._action(member_id).kick = True
+
+    def start(self, workers: int) -> None:
+        self.tasks = [asyncio.create_task(self._work()) for _ in range(workers)]
+
+    def stop(self) -> None:
+        for task in self.tasks:
+            task.cancel()
+
+    async def _work(self) -> None:
+        while True:
+            action = self.pending.pop(await self.queue.get())
+
+            try:
+                try:
+                    await self._run(action)
+                except hikari.NotFoundError:
+                    log.info(
+                        f"Member {action.member_id} left before they were processed"
+                    )
+
+                await _forget(action.member_id)
+            except Exception as exc:
+                # The ledger row stays, so the next boot tries again.
+                log.error(f"Could not act on member {action.member_id}: {exc!r}")
+
+            latency = time.monotonic() - action.queued_at
+            self.done += 1
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+
+            if not self.pending:
+                log.info(
+                    f"Gateway action queue drained ({self.done:,} actions, "
+                    f"{self.total_latency / self.done * 1_000:,.0f} ms average "
+                    f"and {self.max_latency * 1_000:,.0f} ms worst latency)"
+                )
+
+    async def _run(self, action: Action) -> None:
+        await helpers.retry(
+            lambda: self._apply(action),
+            f"Action on member {action.member_id}",
+            retries=ACTION_RETRIES,
+        )
+
+    async def _apply(self, action: Action) -> None:
+        rest = plugin.bot.rest
+
+        if action.kick:
+            return await rest.kick_user(
+                Config.GUILD_ID,
+                action.member_id,
+                reason="Member failed to accept the guidelines before being timed out.",
             )
 
+        if not (
+            member := plugin.bot.cache.get_member(Config.GUILD_ID, action.member_id)
+        ):
+            member = await rest.fetch_member(Config.GUILD_ID, action.member_id)
+
+        # The @everyone role shares the guild's ID and cannot be sent.
+        current = set(member.role_ids) - {Config.GUILD_ID}
+        if action.roles <= current:
+            return
+
+        await rest.edit_member(
+            Config.GUILD_ID,
+            action.member_id,
+            roles=list(current | action.roles),
+            reason="Member accepted the guidelines.",
+        )
+
+
+def _grant_roles(member_id: int) -> None:
+    plugin.d.actions.grant(
+        member_id, {Config.ANNOUNCEMENTS_ROLE_ID, Config.VIDEOS_ROLE_ID}
+    )
+
+
+async def _forget(member_id: int) -> None:
+    await plugin.bot.d.db.execute(
+        "DELETE FROM gateway_members WHERE member_id = ?", member_id
+    )
+
+
+async def take_action(member: hikari.Member) -> None:
+    # The ledger row is only removed once the action has been applied,
+    # so anything still queued at shutdown is reconciled on boot.
+    if member.is_pending:
         log.info(
-            f"Member '{member.display_name}' given roles for accepting the guidelines"
+            f"Member '{member.display_name}' kicked for not accepting the guidelines"
         )
-        for role in [Config.ANNOUNCEMENTS_ROLE_ID, Config.VIDEOS_ROLE_ID]:
-            await plugin.bot.rest.add_role_to_member(
-                Config.GUILD_ID,
-                member,
-                role,
-                reason="Member accepted the guidelines.",
+        plugin.d.actions.kick(member.id)
+        return
+
+    log.info(f"Member '{member.display_name}' given roles for accepting the guidelines")
+    _grant_roles(member.id)
+
+
+async def _take_action(member_id: int) -> None:
+    if not (member := plugin.bot.cache.get_member(Config.GUILD_ID, member_id)):
+        # Deadlines restored on boot can fire before chunking ends.
+        try:
+            member = await plugin.bot.rest.fetch_member(Config.GUILD_ID, member_id)
+        except hikari.NotFoundError:
+            return await _forget(member_id)
+
+    await take_action(member)
+
+
+def schedule_action(member_id: int, secs: float = TIMEOUT) -> None:
+    plugin.d.wheel.schedule(member_id, secs)
+
+
+async def process_deadlines(member_ids: list[int]) -> None:
+    results = await asyncio.gather(
+        *map(_take_action, member_ids), return_exceptions=True
+    )
+
+    for member_id, result in zip(member_ids, results):
+        if isinstance(result, Exception):
+            log.error(f"Could not act on member {member_id}: {result!r}")
+
+
+async def run_wheel() -> None:
+    wheel: TimerWheel = plugin.d.wheel
+
+    while True:
+        # Ticking less often during a burst batches deadlines together.
+        await asyncio.sleep(BURST_TICK if plugin.d.burst.active else wheel.resolution)
+
+        if due := wheel.advance(time.monotonic()):
+            log.info(
+                f"Processing {len(due):,} onboarding deadlines "
+                f"({len(wheel):,} still waiting)"
             )
+            await process_deadlines(due)
 
-    plugin.bot.d.scheduler.add_job(
-        _take_action,
-        id=f"{member.id}",
-        next_run_time=dt.datetime.utcnow() + dt.timedelta(seconds=secs),
-        args=[member.id],
+
+async def record_member(member: hikari.Member) -> None:
+    await plugin.bot.d.db.execute(
+        "INSERT OR REPLACE INTO gateway_members VALUES (?, ?, ?)",
+        member.id,
+        member.joined_at.timestamp(),
+        member.is_pending,
     )
 
 
-@plugin.listener(hikari.StartedEvent)
-async def on_started(_: hikari.StartedEvent) -> None:
-    async for m in plugin.bot.rest.fetch_members(Config.GUILD_ID):
-        if (secs := (chron.aware_now() - m.joined_at).seconds) <= TIMEOUT:
+def reconcile_humans() -> None:
+    # Joins and leaves keep the count up to date between runs; this just
+    # corrects any drift from missed events.
+    members = plugin.bot.cache.get_members_view_for_guild(Config.GUILD_ID)
+    humans = sum(not m.is_bot for m in members.values())
+
+    if humans != plugin.d.humans:
+        log.info(f"Human member count corrected from {plugin.d.humans:,} to {humans:,}")
+        plugin.d.humans = humans
+
+
+async def reconcile_ledger() -> None:
+    # Every row is a member whose deadline had not been dealt with when
+    # we went down, so this scales with those rather than guild size.
+    rows = await plugin.bot.d.db.fetch_records("SELECT * FROM gateway_members")
+    now = chron.aware_now().timestamp()
+
+    for row in rows:
+        if (secs := TIMEOUT - (now - row.joined_at)) > 0:
+            schedule_action(row.member_id, secs=secs)
+            continue
+
+        if not row.pending:
+            # Accepting is final, so there is no need to look them up.
+            log.info(f"Member {row.member_id} given roles (on boot)")
+            _grant_roles(row.member_id)
+            continue
+
+        try:
+            member = await plugin.bot.rest.fetch_member(Config.GUILD_ID, row.member_id)
+        except hikari.NotFoundError:
+            await _forget(row.member_id)
+            continue
+
+        await take_action(member)
+
+    log.info(f"Reconciled {len(rows):,} members left in the gateway ledger")
+
+
+async def catch_up_joins() -> None:
+    # The cache only knows about members who joined while we were down
+    # once chunking finishes, and nothing older than the last heartbeat
+    # can be missing from the ledger.
+    seen_at = await plugin.bot.d.db.try_fetch_record(
+        "SELECT seen_at FROM gateway_heartbeat"
+    )
+    since = seen_at.seen_at if seen_at else 0
+    rows = await plugin.bot.d.db.fetch_records("SELECT member_id FROM gateway_members")
+    known = {row.member_id for row in rows}
+    now = chron.aware_now()
+    joined = [
+        m
+        for m in plugin.bot.cache.get_members_view_for_guild(Config.GUILD_ID).values()
+        if m.joined_at.timestamp() > since and m.id not in known
+    ]
+
+    for m in joined:
+        if (secs := TIMEOUT - (now - m.joined_at).total_seconds()) > 0:
             log.info(
                 f"Member '{m.display_name}' joined while offline, scheduling action "
-                f"in {TIMEOUT-secs} seconds..."
+                f"in {secs:,.0f} seconds..."
             )
-            await schedule_action(m, secs=TIMEOUT - secs)
+            await record_member(m)
+            schedule_action(m.id, secs=secs)
 
         elif m.is_pending:
             log.info(
                 f"Member '{m.display_name}' kicked for not accepting the guidelines "
                 "(on boot)"
             )
-            await m.kick(
-                reason="Member failed to accept the guidelines before being timed out."
+            plugin.d.actions.kick(m.id)
+
+    log.info(f"Caught up on {len(joined):,} members who joined while offline")
+
+
+async def heartbeat() -> None:
+    await plugin.bot.d.db.execute(
+        "INSERT INTO gateway_heartbeat VALUES (0, ?) "
+        "ON CONFLICT (id) DO UPDATE SET seen_at = excluded.seen_at",
+        chron.aware_now().timestamp(),
+    )
+
+
+def _batches(items: list[str]) -> t.Iterator[list[str]]:
+    batch: list[str] = []
+    size = 0
+
+    for item in items:
+        if batch and size + len(item) > MESSAGE_BUDGET:
+            yield batch
+            batch, size = [], 0
+
+        batch.append(item)
+        size += len(item) + 2
+
+    if batch:
+        yield batch
+
+
+async def send_welcome(mentions: list[str]) -> None:
+    for batch in _batches(mentions):
+        await plugin.bot.rest.create_message(
+            Config.GATEWAY_CHANNEL_ID,
+            f"Welcome {string.list_of(batch)}! "
+            + (
+                f"You are member nº {plugin.d.humans:,} of the Carberra server "
+                "(excluding bots). "
+                if len(mentions) == 1
+                else f"The Carberra server now has {plugin.d.humans:,} members "
+                "(excluding bots). "
             )
+            + "Make yourself at home in <#626608699942764548>, and look at "
+            "<#739572184745377813> to find out how to get support.",
+        )
+
+
+async def send_departures(departures: list[str]) -> None:
+    for batch in _batches(departures):
+        await plugin.bot.rest.create_message(
+            Config.GATEWAY_CHANNEL_ID,
+            f"{string.list_of(batch)} "
+            f"{'is' if len(batch) == 1 else 'are'} no longer in the server.",
+        )
+
+
+async def flush_burst() -> None:
+    burst: BurstDetector = plugin.d.burst
+
+    if stats := burst.settle(time.monotonic()):
+        duration, joins, peak = stats
+        log.info(
+            f"Join burst ended after {duration:,.0f} seconds ({joins:,} joins, "
+            f"peaking at {peak:,} per {burst.window:,} seconds; "
+            f"{plugin.d.burst_welcomes:,} welcomes and "
+            f"{len(plugin.d.departures):,} departures batched)"
+        )
+        plugin.d.burst_welcomes = 0
+
+    if welcomes := plugin.d.welcomes:
+        plugin.d.welcomes = []
+        await send_welcome(welcomes)
+
+    # Departure notices can wait until things calm down.
+    if not burst.active and (departures := plugin.d.departures):
+        plugin.d.departures = []
+        await send_departures(departures)
+
+
+@plugin.listener(hikari.MemberChunkEvent)
+async def on_member_chunk(event: hikari.MemberChunkEvent) -> None:
+    if event.guild_id == Config.GUILD_ID and event.chunk_index == event.chunk_count - 1:
+        # The cache holds every member once the last chunk arrives.
+        reconcile_humans()
+
+        if not plugin.d.caught_up:
+            plugin.d.caught_up = True
+            await catch_up_joins()
+            # Only start the heartbeat now, otherwise a restart before
+            # catching up would skip joins from the offline window.
+            await heartbeat()
+            plugin.bot.d.scheduler.add_job(heartbeat, CronTrigger(second=45))
+
+
+@plugin.listener(hikari.StartedEvent)
+async def on_started(_: hikari.StartedEvent) -> None:
+    plugin.d.actions = ActionQueue()
+    plugin.d.actions.start(ACTION_WORKERS)
+    plugin.d.wheel = TimerWheel(WHEEL_SIZE, WHEEL_RESOLUTION)
+    plugin.d.wheel_task = asyncio.create_task(run_wheel())
+    plugin.d.burst = BurstDetector(BURST_WINDOW, BURST_THRESHOLD)
+    plugin.d.burst_welcomes = 0
+    plugin.d.welcomes = []
+    plugin.d.departures = []
+    plugin.bot.d.scheduler.add_job(flush_burst, IntervalTrigger(seconds=BURST_INTERVAL))
+    plugin.d.humans = 0
+    plugin.d.caught_up = False
+    reconcile_humans()
+    plugin.bot.d.scheduler.add_job(reconcile_humans, CronTrigger(minute=30, second=0))
+
+    await reconcile_ledger()
 
 
 @plugin.listener(hikari.MemberCreateEvent)
@@ -102,12 +537,25 @@ async def on_member_join(event: hikari.MemberCreateEvent) -> None:
     if event.member.guild_id != Config.GUILD_ID:
         return
 
+    if not event.member.is_bot:
+        plugin.d.humans += 1
+
     log.info(f"Member '{event.member.display_name}' joined")
-    await schedule_action(event.member)
+    if plugin.d.burst.record(time.monotonic()):
+        log.warning(
+            f"Join burst detected ({BURST_THRESHOLD:,} joins within "
+            f"{BURST_WINDOW:,} seconds), batching gateway work"
+        )
+
+    await record_member(event.member)
+    schedule_action(event.member.id)
 
 
 @plugin.listener(hikari.MemberDeleteEvent)
 async def on_member_leave(event: hikari.MemberDeleteEvent) -> None:
+    if event.guild_id == Config.GUILD_ID and not event.user.is_bot:
+        plugin.d.humans -= 1
+
     member = event.old_member
 
     if not member:
@@ -116,19 +564,23 @@ async def on_member_leave(event: hikari.MemberDeleteEvent) -> None:
     if member.guild_id != Config.GUILD_ID:
         return
 
-    try:
-        plugin.bot.d.scheduler.get_job(f"{member.id}").remove()
+    await _forget(member.id)
+
+    if plugin.d.wheel.cancel(member.id):
         return
-    except AttributeError:
-        if member.is_pending:
-            log.info(f"Member '{member.display_name}' left (was pending)")
-            return
 
-        log.info(f"Member '{member.display_name}' left")
-        await plugin.bot.rest.create_message(
-            Config.GATEWAY_CHANNEL_ID,
-            f"{member.display_name} is no longer in the server. (ID: {member.id})",
-        )
+    if member.is_pending:
+        log.info(f"Member '{member.display_name}' left (was pending)")
+        return
+
+    log.info(f"Member '{member.display_name}' left")
+    departure = f"{member.display_name} (ID: {member.id})"
+
+    if plugin.d.burst.active:
+        plugin.d.departures.append(departure)
+        return
+
+    await send_departures([departure])
 
 
 @plugin.listener(hikari.MemberUpdateEvent)
@@ -140,24 +592,31 @@ async def on_member_update(event: hikari.MemberUpdateEvent) -> None:
         return
 
     if event.old_member.is_pending != event.member.is_pending:
+        await plugin.bot.d.db.execute(
+            "UPDATE gateway_members SET pending = 0 WHERE member_id = ?",
+            event.member.id,
+        )
         log.info(
             f"Member '{event.member.display_name}' accepted rules. "
             "Waiting to give roles..."
         )
-        humans = len(
-            [
-                m
-                async for m in plugin.bot.rest.fetch_members(Config.GUILD_ID)
-                if not m.is_bot
-            ]
-        )
-        await plugin.bot.rest.create_message(
-            Config.GATEWAY_CHANNEL_ID,
-            f"Welcome {event.member.mention}! You are member nº {humans:,} of "
-            "the Carberra server (excluding bots). Make yourself at home "
-            "in <#626608699942764548>, and look at <#739572184745377813> "
-            "to find out how to get support.",
-        )
+
+        if plugin.d.burst.active:
+            plugin.d.welcomes.append(event.member.mention)
+            plugin.d.burst_welcomes += 1
+            return
+
+        await send_welcome([event.member.mention])
+
+
+@plugin.listener(hikari.StoppingEvent)
+async def on_stopping(_: hikari.StoppingEvent) -> None:
+    plugin.d.wheel_task.cancel()
+    plugin.d.actions.stop()
+    log.info(
+        f"Stopped onboarding timer wheel ({len(plugin.d.wheel):,} waiting) and "
+        f"action queue ({len(plugin.d.actions):,} waiting)"
+    )
 
 
 def load(bot: lightbulb.BotApp) -> None:
@@ -28,15 +28,30 @@
 
 from __future__ import annotations
 
+import asyncio
 import logging
+import time
+import typing as t
 
 import lightbulb
 
-from carberretta.utils import string
+from carberretta.utils import chron, string
+
+if t.TYPE_CHECKING:
+    from carberretta.utils.logs import LogArchive, LogStore
 
 plugin = lightbulb.Plugin("Admin")
 log = logging.getLogger(__name__)
 
+LOG_LEVELS: t.Final = {
+    "C": logging.CRITICAL,
+    "E": logging.ERROR,
+    "W": logging.WARNING,
+    "I": logging.INFO,
+    "D": logging.DEBUG,
+    "T": logging.NOTSET,
+}
+
 
 @plugin.command()
 @lightbulb.add_checks(lightbulb.owner_only)
@@ -50,27 +65,61 @@ async def cmd_shutdown(ctx: lightbulb.SlashContext) -> None:
 
 @plugin.command()
 @lightbulb.add_checks(lightbulb.owner_only)
+@lightbulb.option(
+    "until",
+    "Only view logs up to this time (ISO 8601 time or duration ago).",
+    required=False,
+)
+@lightbulb.option(
+    "since",
+    "Only view logs from this time (ISO 8601 time or duration ago).",
+    required=False,
+)
 @lightbulb.option(
     "level", "The minimum logging level to view logs for.", choices="CEWIDT"
 )
 @lightbulb.command("logs", "View Carberretta's logs.", ephemeral=True)
 @lightbulb.implements(lightbulb.SlashCommand)
 async def cmd_logs(ctx: lightbulb.SlashContext) -> None:
-    if ctx.options.level == "T":
-        # TRACE data runs across multiple lines. There's no point in
-        # processing anyways, so just return the raw data.
-        records = plugin.app.d.logs.getvalue()
-    else:
-        levels = "CEWID"
-        idx = levels.index(ctx.options.level)
-        records = "\n".join(
-            filter(
-                lambda x: any(f"[ {l} ]" in x for l in levels[: idx + 1]),
-                plugin.app.d.logs.getvalue().strip().split("\n"),
-            )
+    store: LogStore = plugin.app.d.logs
+    archive: LogArchive | None = plugin.app.d.log_archive
+    min_level = LOG_LEVELS[ctx.options.level]
+
+    try:
+        since, until = (
+            chron.parse_moment(value).timestamp() if value else None
+            for value in (ctx.options.since, ctx.options.until)
         )
+    except ValueError:
+        await ctx.respond("Times should be ISO 8601 timestamps or durations.")
+        return
+
+    # Memory only covers recent history; anything older than that has
+    # to come from the archive on disk.
+    note = ""
+    oldest = store.oldest or time.time()
+    if archive and (since or until) and (since is None or since < oldest):
+        records, total, segments = await asyncio.to_thread(
+            archive.query, min_level, since, until
+        )
+        note = f" (from {segments:,} archived segment(s)"
+        if total > len(records):
+            note += f"; only the newest {len(records):,} of {total:,} records"
+        note += ")"
+    else:
+        records = store.query(min_level, since, until)
+        evicted = store.evictions(min_level)
+        if evicted and (since is None or since < oldest):
+            note = f" ({evicted:,} older records have been evicted)"
 
-    await ctx.respond(await string.binify(plugin.app.d.session, records, "logs"))
+    if not records:
+        await ctx.respond("There are no logs matching those filters.")
+        return
+
+    url = await string.binify(
+        plugin.app.d.session, "\n".join(records), "logs", db=plugin.app.d.db
+    )
+    await ctx.respond(url + note)
 
 
 @plugin.command()
@@ -100,6 +149,7 @@ async def cmd_error(ctx: lightbulb.SlashContext) -> None:
             plugin.app.d.session,
             f"Command: /{row.err_cmd}\nAt: {row.err_time}\n\n{row.err_text}",
             row.err_id,
+            db=plugin.app.d.db,
         )
     )
 
@@ -28,21 +28,64 @@
 
 from __future__ import annotations
 
+import asyncio
 import datetime as dt
+import functools
+import logging
 import re
+import time
+import typing as t
+from dataclasses import dataclass
 
 import hikari
 import lightbulb
+from apscheduler.triggers.cron import CronTrigger
 
-from carberretta.utils import chron
+from carberretta import Config
+from carberretta.utils import chron, helpers
 
-plugin = lightbulb.Plugin("Mod")
+plugin = lightbulb.Plugin("Mod", include_datastore=True)
+log = logging.getLogger(__name__)
 
 _chars = "".join(
     chr(i) for i in [*range(0x20, 0x30), *range(0x3A, 0x41), *range(0x5B, 0x61)]
 )
 UNHOIST_PATTERN = re.compile(rf"[{_chars}]+")
 del _chars
+# Bulk deletes only accept messages under two weeks old, so leave a
+# little headroom for the time the command takes.
+BULK_DELETE_AGE: t.Final = dt.timedelta(days=14, minutes=-5)
+CLEAR_CHUNK_SIZE: t.Final = 100
+# Interaction tokens last 15 minutes; stop editing the response a little
+# before that and just log instead.
+TOKEN_LIFETIME: t.Final = 840
+UNHOIST_PROGRESS_INTERVAL: t.Final = 10
+UNHOIST_RETRIES: t.Final = 3
+UNHOIST_WORKERS: t.Final = Config.get("UNHOIST_WORKERS", 4)
+AUTO_UNHOIST: t.Final = Config.get("AUTO_UNHOIST", False)
+# Members often change their nickname a few times in a row, so wait for
+# them to settle before editing.
+AUTO_UNHOIST_DELAY: t.Final = 5.0
+AUTO_UNHOIST_TICK: t.Final = 1.0
+
+
+@dataclass(slots=True)
+class EventTimings:
+    count: int = 0
+    total: float = 0.0
+    worst: float = 0.0
+
+    def __str__(self) -> str:
+        mean = self.total / self.count if self.count else 0.0
+        return (
+            f"{self.count:,} events, mean {mean * 1e6:,.1f}us, "
+            f"worst {self.worst * 1e6:,.1f}us"
+        )
+
+    def add(self, elapsed: float) -> None:
+        self.count += 1
+        self.total += elapsed
+        self.worst = max(self.worst, elapsed)
 
 
 @plugin.command()
@@ -58,7 +101,7 @@ del _chars
     type=hikari.Member,
     required=False,
 )
-@lightbulb.option("limit", "The number of messages to clear.", type=int)
+@lightbulb.option("limit", "The number of messages to clear.", type=int, min_value=1)
 @lightbulb.command(
     "clear",
     description="Clear messages in this channel.",
@@ -73,45 +116,265 @@ async def cmd_clear(ctx: lightbulb.SlashContext) -> None:
     if not isinstance(channel, hikari.GuildTextChannel):
         return
 
-    history = channel.fetch_history(
-        after=ctx.options.after or chron.aware_now() - dt.timedelta(days=14)
+    limit: int = ctx.options.limit
+    if limit < 1:
+        await ctx.respond("The limit must be at least 1.")
+        return
+
+    after = int(ctx.options.after) if ctx.options.after else 0
+    member_id = ctx.options.member.id if ctx.options.member else None
+    cutoff = chron.aware_now() - BULK_DELETE_AGE
+    chunks: asyncio.Queue[list[hikari.Message] | None] = asyncio.Queue()
+    cleared = 0
+
+    async def delete(channel: hikari.GuildTextChannel) -> None:
+        nonlocal cleared
+
+        # Bulk deletes in a channel share one rate limit bucket, so one
+        # consumer is as fast as it gets; hikari waits on the bucket.
+        while (chunk := await chunks.get()) is not None:
+            await channel.delete_messages(chunk)
+            cleared += len(chunk)
+            await ctx.edit_last_response(f"Cleared {cleared:,} message(s) so far...")
+
+    deleter = asyncio.create_task(delete(channel))
+    chunk: list[hikari.Message] = []
+    found = 0
+
+    try:
+        # History comes newest first, so we can stop as soon as we have
+        # enough, and deleting starts before the scan is finished.
+        async for message in channel.fetch_history():
+            if deleter.done() or message.created_at < cutoff or message.id <= after:
+                break
+
+            if member_id and message.author.id != member_id:
+                continue
+
+            chunk.append(message)
+            found += 1
+
+            if len(chunk) == CLEAR_CHUNK_SIZE or found >= limit:
+                chunks.put_nowait(chunk)
+                chunk = []
+
+            if found >= limit:
+                break
+
+        if chunk:
+            chunks.put_nowait(chunk)
+    finally:
+        chunks.put_nowait(None)
+
+    await deleter
+    await ctx.edit_last_response(f"Cleared {cleared:,} message(s).")
+
+
+def _unhoisted(name: str) -> str | None:
+    if not (match := UNHOIST_PATTERN.match(name)):
+        return None
+
+    return name.replace(match.group(), "", 1)
+
+
+async def _unhoist_member(guild_id: int, member_id: int) -> bool:
+    if not (member := plugin.app.cache.get_member(guild_id, member_id)):
+        member = await plugin.app.rest.fetch_member(guild_id, member_id)
+
+    # The name may have changed since the snapshot was taken.
+    if (nickname := _unhoisted(member.display_name)) is None:
+        return False
+
+    await helpers.retry(
+        functools.partial(member.edit, nickname=nickname),
+        f"Unhoisting member {member_id}",
+        retries=UNHOIST_RETRIES,
+    )
+    return True
+
+
+async def run_unhoist(
+    progress: t.Callable[[str], t.Awaitable[None]] | None = None
+) -> None:
+    # Each row is removed once handled, so the table doubles as the
+    # checkpoint a restarted bot resumes from.
+    db = plugin.app.d.db
+    rows = await db.fetch_records("SELECT guild_id, member_id FROM unhoist_queue")
+    queue: asyncio.Queue[tuple[int, int]] = asyncio.Queue()
+    for row in rows:
+        queue.put_nowait((row.guild_id, row.member_id))
+
+    total = len(rows)
+    done = edited = 0
+    start = time.perf_counter()
+
+    async def work() -> None:
+        nonlocal done, edited
+
+        while not queue.empty():
+            guild_id, member_id = queue.get_nowait()
+
+            try:
+                edited += await _unhoist_member(guild_id, member_id)
+            except hikari.NotFoundError:
+                pass
+            except Exception as exc:
+                log.error(f"Could not unhoist member {member_id}: {exc!r}")
+
+            await db.execute("DELETE FROM unhoist_queue WHERE member_id = ?", member_id)
+            done += 1
+
+    async def report() -> None:
+        while True:
+            await asyncio.sleep(UNHOIST_PROGRESS_INTERVAL)
+            log.info(f"Unhoisting nicknames: {done:,} of {total:,} checked")
+            if progress:
+                await progress(
+                    f"Unhoisted {edited:,} nicknames so far ({done:,}/{total:,})."
+                )
+
+    reporter = asyncio.create_task(report())
+    try:
+        await asyncio.gather(*(work() for _ in range(UNHOIST_WORKERS)))
+    finally:
+        reporter.cancel()
+
+    await db.commit()
+    log.info(
+        f"Unhoisted {edited:,} of {total:,} nicknames in "
+        f"{time.perf_counter() - start:,.1f} seconds"
+    )
+    if progress:
+        await progress(f"Unhoisted {edited:,} nicknames.")
+
+
+def _check_name(member: hikari.Member, before: str | None, kind: str) -> None:
+    start = time.perf_counter()
+
+    # Only the display name matters, so most updates (roles, avatars,
+    # timeouts) stop at the first comparison.
+    name = member.display_name
+    if name != before and not member.is_bot and UNHOIST_PATTERN.match(name):
+        # Pushing the deadline back on every change debounces the edit.
+        key = (member.guild_id, member.id)
+        plugin.d.unhoist_due[key] = time.monotonic() + AUTO_UNHOIST_DELAY
+
+    plugin.d.event_timings[kind].add(time.perf_counter() - start)
+
+
+async def run_auto_unhoist() -> None:
+    due: dict[tuple[int, int], float] = plugin.d.unhoist_due
+
+    while True:
+        await asyncio.sleep(AUTO_UNHOIST_TICK)
+        now = time.monotonic()
+
+        for key in [key for key, when in due.items() if when <= now]:
+            del due[key]
+
+            try:
+                # This rechecks the current name, so members who fixed
+                # it themselves in the meantime are left alone.
+                plugin.d.auto_unhoisted += await _unhoist_member(*key)
+            except hikari.NotFoundError:
+                pass
+            except Exception as exc:
+                log.error(f"Could not unhoist member {key[1]}: {exc!r}")
+
+
+async def _log_event_timings() -> None:
+    for kind, timings in plugin.d.event_timings.items():
+        log.info(f"Auto-unhoist {kind} checks: {timings}")
+
+    log.info(
+        f"Auto-unhoisted {plugin.d.auto_unhoisted:,} nicknames "
+        f"({len(plugin.d.unhoist_due):,} pending)"
     )
-    if ctx.options.member:
-        # Mypy is literally the worst piece of software ever written, I
-        # swear to God. See python/mypy#9656 for more info.
-        pred = lambda m: m.author.id == ctx.options.member.id
-        history = history.filter(pred)
-    messages = list(reversed(await history))
 
-    for i in range(0, ctx.options.limit, 100):
-        await channel.delete_messages(messages[i : min(i + 100, ctx.options.limit)])
-    await ctx.respond(f"Cleared {min(ctx.options.limit, len(messages))} message(s).")
+
+@plugin.listener(hikari.MemberCreateEvent)
+async def on_member_create(event: hikari.MemberCreateEvent) -> None:
+    if AUTO_UNHOIST:
+        _check_name(event.member, None, "join")
+
+
+@plugin.listener(hikari.MemberUpdateEvent)
+async def on_member_update(event: hikari.MemberUpdateEvent) -> None:
+    if AUTO_UNHOIST:
+        before = event.old_member.display_name if event.old_member else None
+        _check_name(event.member, before, "update")
+
+
+@plugin.listener(hikari.StartedEvent)
+async def on_started(_: hikari.StartedEvent) -> None:
+    if AUTO_UNHOIST:
+        plugin.d.unhoist_due = {}
+        plugin.d.auto_unhoisted = 0
+        plugin.d.event_timings = {"join": EventTimings(), "update": EventTimings()}
+        plugin.d.auto_unhoist_task = asyncio.create_task(run_auto_unhoist())
+        plugin.app.d.scheduler.add_job(_log_event_timings, CronTrigger(minute=0))
+
+    if await plugin.app.d.db.try_fetch_record("SELECT 1 AS pending FROM unhoist_queue"):
+        log.info("Resuming an unfinished unhoist")
+        plugin.d.unhoist_task = asyncio.create_task(run_unhoist())
 
 
 @plugin.command()
 @lightbulb.add_checks(
     lightbulb.has_guild_permissions(hikari.Permissions.MANAGE_NICKNAMES)
 )
+@lightbulb.option(
+    "dry_run",
+    "Only count the nicknames that would be unhoisted.",
+    type=bool,
+    default=False,
+)
 @lightbulb.command("unhoist", "Unhoist nicknames.", ephemeral=True, auto_defer=True)
 @lightbulb.implements(lightbulb.SlashCommand)
 async def cmd_unhoist(ctx: lightbulb.SlashContext) -> None:
     if not (guild := ctx.get_guild()):
         return
 
-    count = 0
+    if (task := plugin.d.unhoist_task) and not task.done():
+        await ctx.respond("Nicknames are already being unhoisted.")
+        return
+
+    # Snapshot the IDs up front; the workers recheck each name anyway.
+    member_ids = [
+        member.id
+        for member in guild.get_members().values()
+        if not member.is_bot and UNHOIST_PATTERN.match(member.display_name)
+    ]
+
+    if ctx.options.dry_run:
+        await ctx.respond(f"{len(member_ids):,} nicknames would be unhoisted.")
+        return
+
+    if not member_ids:
+        await ctx.respond("There are no nicknames to unhoist.")
+        return
+
+    await plugin.app.d.db.executemany(
+        "INSERT OR IGNORE INTO unhoist_queue VALUES (?, ?)",
+        *((guild.id, member_id) for member_id in member_ids),
+    )
+    await plugin.app.d.db.commit()
+    await ctx.respond(f"Unhoisting {len(member_ids):,} nicknames in the background...")
+
+    expires = time.monotonic() + TOKEN_LIFETIME
 
-    for _, member in guild.get_members().items():
-        if member.is_bot:
-            continue
+    async def progress(content: str) -> None:
+        if time.monotonic() < expires:
+            await ctx.edit_last_response(content)
 
-        match = UNHOIST_PATTERN.match(member.display_name)
-        if not match:
-            continue
+    plugin.d.unhoist_task = asyncio.create_task(run_unhoist(progress))
 
-        await member.edit(nickname=member.display_name.replace(match.group(), "", 1))
-        count += 1
 
-    await ctx.respond(f"Unhoisted {count:,} nicknames.")
+@plugin.listener(hikari.StoppingEvent)
+async def on_stopping(_: hikari.StoppingEvent) -> None:
+    if task := plugin.d.auto_unhoist_task:
+        task.cancel()
+        await _log_event_timings()
 
 
 def load(bot: lightbulb.BotApp) -> None:
@@ -28,19 +28,34 @@
 
 from __future__ import annotations
 
+import array
+import asyncio
+import bisect
+import functools
+import heapq
 import io
 import logging
+import mmap
+import os
 import re
+import struct
+import time
 import typing as t
 import zlib
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from pathlib import Path
 
 import hikari
 import lightbulb
+import numpy as np
 from apscheduler.triggers.cron import CronTrigger
 from rapidfuzz import fuzz, process
 
-from carberretta.utils import chron, helpers
+from carberretta import Config
+from carberretta.utils import chron, helpers, string
+
+if t.TYPE_CHECKING:
+    from aiohttp import ClientSession
 
 
 @dataclass
@@ -50,142 +65,702 @@ class NamedCache:
     type: str
 
 
+class RenderedResult(t.NamedTuple):
+    choices: tuple[str, ...]
+    description: str
+
+
 if t.TYPE_CHECKING:
     CachedObjT = dict[str, NamedCache]
 
+
+class SearchIndex:
+    __slots__ = ("names", "buckets")
+
+    # Names are ordered by length, then alphabetically, and grouped by
+    # length so whole groups can be skipped: a name of length `lc` can
+    # never score more than 200 * min(lq, lc) / (lq + lc) against a
+    # query of length `lq`, so once enough results beat that bound
+    # there is no point in looking at the group.
+    def __init__(self, names: list[str], buckets: dict[int, tuple[int, int]]) -> None:
+        self.names = names
+        self.buckets = buckets
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    @classmethod
+    def from_names(cls, names: t.Iterable[str]) -> SearchIndex:
+        ordered = sorted(names, key=lambda n: (len(n), n))
+        buckets: dict[int, tuple[int, int]] = {}
+
+        for position, name in enumerate(ordered):
+            start, _ = buckets.get(len(name), (position, position))
+            buckets[len(name)] = (start, position + 1)
+
+        return cls(ordered, buckets)
+
+    def find(self, name: str) -> int | None:
+        if (bucket := self.buckets.get(len(name))) is None:
+            return None
+
+        position = bisect.bisect_left(self.names, name, *bucket)
+        return position if self.names[position : position + 1] == [name] else None
+
+    def search(self, value: str, limit: int) -> list[tuple[str, int]]:
+        if not value:
+            # Everything scores 0, so this is what a full scan returns.
+            return [(name, i) for i, name in enumerate(self.names[:limit])]
+
+        def _bound(length: int) -> float:
+            return 200 * min(len(value), length) / (len(value) + length)
+
+        results: list[tuple[float, int, str]] = []
+        threshold = 0.0
+
+        for length in sorted(self.buckets, key=_bound, reverse=True):
+            # The tolerance keeps float rounding from dropping ties.
+            if len(results) >= limit and _bound(length) < threshold - 1e-6:
+                break
+
+            start, stop = self.buckets[length]
+            for name, score, i in process.extract(
+                value,
+                self.names[start:stop],
+                scorer=fuzz.QRatio,
+                limit=limit,
+                score_cutoff=threshold,
+            ):
+                results.append((-score, start + i, name))
+
+            if len(results) >= limit:
+                results = heapq.nsmallest(limit, results)
+                threshold = -results[-1][0]
+
+        # Ties are broken by position, which is what a single extraction
+        # over every name would do.
+        return [(name, position) for _, position, name in sorted(results)[:limit]]
+
+
+class MappedInventory:
+    __slots__ = (
+        "index",
+        "etag",
+        "built_at",
+        "_offsets",
+        "_type_ids",
+        "_types",
+        "_links",
+    )
+
+    # The on-disk layout, in order: the header, the ETag, the type
+    # names, the object names (newline separated, in index order), then
+    # 4-byte aligned arrays for the bucket table, the link offsets and
+    # the type IDs, followed by the link string table. Only the names
+    # are decoded up front; everything else is read from the mapped
+    # pages when an object is resolved.
+    HEADER: t.Final = struct.Struct("=8sHHQIIIIII")
+    MAGIC: t.Final = b"RTFMIDX\0"
+    FORMAT_VERSION: t.Final = 1
+    BYTE_ORDER_MARK: t.Final = 0x0102
+
+    def __init__(self, buffer: t.Any) -> None:
+        view = memoryview(buffer)
+
+        try:
+            header = self.HEADER.unpack_from(view)
+        except struct.error:
+            raise ValueError("RTFM index is truncated") from None
+
+        if header[:3] != (self.MAGIC, self.FORMAT_VERSION, self.BYTE_ORDER_MARK):
+            raise ValueError("RTFM index was written by an incompatible version")
+
+        built_at, count, n_buckets, *sizes = header[3:]
+        etag_size, types_size, names_size, links_size = sizes
+        pos = self.HEADER.size
+
+        def _take(size: int) -> memoryview:
+            nonlocal pos
+            if pos + size > len(view):
+                raise ValueError("RTFM index is truncated")
+            pos += size
+            return view[pos - size : pos]
+
+        self.etag = str(_take(etag_size), "utf-8") or None
+        self.built_at: int = built_at
+        self._types = str(_take(types_size), "utf-8").split("\n")
+        names = str(_take(names_size), "utf-8").split("\n") if count else []
+        _take(-pos % 4)
+        table = _take(n_buckets * 12).cast("I")
+        self._offsets = _take((count + 1) * 4).cast("I")
+        self._type_ids = _take(count * 2).cast("H")
+        self._links = _take(links_size)
+
+        self.index = SearchIndex(
+            names,
+            {table[i]: (table[i + 1], table[i + 2]) for i in range(0, len(table), 3)},
+        )
+
+    def __contains__(self, name: str) -> bool:
+        return self.index.find(name) is not None
+
+    @classmethod
+    def from_file(cls, path: Path) -> MappedInventory:
+        with open(path, "rb") as f:
+            return cls(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    @staticmethod
+    def pack(cache: CachedObjT, etag: str | None, built_at: int | None = None) -> bytes:
+        index = SearchIndex.from_names(cache)
+        types: dict[str, int] = {}
+        offsets = array.array("I", [0])
+        type_ids = array.array("H")
+        links = bytearray()
+
+        for name in index.names:
+            links += cache[name].link.encode("utf-8")
+            offsets.append(len(links))
+            type_ids.append(types.setdefault(cache[name].type, len(types)))
+
+        table = array.array(
+            "I",
+            [x for length, bucket in index.buckets.items() for x in (length, *bucket)],
+        )
+        etag_data = (etag or "").encode("utf-8")
+        types_data = "\n".join(types).encode("utf-8")
+        names_data = "\n".join(index.names).encode("utf-8")
+        header = MappedInventory.HEADER.pack(
+            MappedInventory.MAGIC,
+            MappedInventory.FORMAT_VERSION,
+            MappedInventory.BYTE_ORDER_MARK,
+            time.time_ns() if built_at is None else built_at,
+            len(index.names),
+            len(index.buckets),
+            len(etag_data),
+            len(types_data),
+            len(names_data),
+            len(links),
+        )
+        data = header + etag_data + types_data + names_data
+
+        return b"".join(
+            (
+                data,
+                bytes(-len(data) % 4),
+                table.tobytes(),
+                offsets.tobytes(),
+                type_ids.tobytes(),
+                links,
+            )
+        )
+
+    def get(self, name: str) -> NamedCache | None:
+        if (position := self.index.find(name)) is None:
+            return None
+
+        start, stop = self._offsets[position], self._offsets[position + 1]
+        link = str(self._links[start:stop], "utf-8")
+        return NamedCache(name, link, self._types[self._type_ids[position]])
+
+
+@dataclass(slots=True, eq=False)
+class Inventory:
+    name: str
+    url: str
+    data: MappedInventory = field(
+        default_factory=lambda: MappedInventory(MappedInventory.pack({}, None, 0)),
+        repr=False,
+    )
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.data
+
+    @property
+    def index(self) -> SearchIndex:
+        return self.data.index
+
+    @property
+    def version(self) -> int:
+        return self.data.built_at
+
+    def resolve(self, match: str) -> str:
+        if (obj := self.data.get(match)) is None:
+            raise KeyError(match)
+
+        if obj.link[-1:] == "$":
+            return f"{self.url}{obj.link[:-1]}{obj.direct}"
+
+        return f"{self.url}{obj.link}"
+
+
+@dataclass(slots=True, eq=False)
+class MergedIndex:
+    # Every inventory's length groups are laid out back to back in one
+    # index. `starts` holds the position at which each run begins, and
+    # `sources` the inventory the run came from. Any rebuilt inventory
+    # is newer than the rest, so the newest build doubles as a version.
+    name: t.ClassVar[str] = "all"
+    index: SearchIndex = field(default_factory=lambda: SearchIndex([], {}))
+    starts: list[int] = field(default_factory=list)
+    sources: list[Inventory] = field(default_factory=list)
+    version: int = 0
+
+    @classmethod
+    def from_inventories(cls, inventories: t.Iterable[Inventory]) -> MergedIndex:
+        merged = cls()
+        inventories = list(inventories)
+        lengths = sorted({n for i in inventories for n in i.index.buckets})
+        names: list[str] = []
+        buckets: dict[int, tuple[int, int]] = {}
+
+        for length in lengths:
+            start = len(names)
+
+            for inventory in inventories:
+                if (bucket := inventory.index.buckets.get(length)) is None:
+                    continue
+
+                merged.starts.append(len(names))
+                merged.sources.append(inventory)
+                names.extend(inventory.index.names[slice(*bucket)])
+
+            buckets[length] = (start, len(names))
+
+        merged.index = SearchIndex(names, buckets)
+        merged.version = max((i.version for i in inventories), default=0)
+        return merged
+
+    def source_of(self, position: int) -> Inventory:
+        return self.sources[bisect.bisect_right(self.starts, position) - 1]
+
+
 plugin = lightbulb.Plugin("RTFM", include_datastore=True)
 CHUNK_REGEX: t.Final = re.compile(r"(?x)(.+?)\s+(\S*:\S*)\s+(-?\d+)\s+(\S+)\s+(.*)")
-HIKARI_DOCS_URL: t.Final = "https://www.hikari-py.dev/"
-LIGHTBULB_DOCS_URL: t.Final = "https://hikari-lightbulb.readthedocs.io/en/latest/"
-PYTHON_DOCS_URL: t.Final = "https://docs.python.org/3/"
+TAG_REGEX: t.Final = re.compile(r"(.+) \(([\w-]+)\)")
+NAME_REGEX: t.Final = re.compile(r"[-_\w]{1,32}")
+DEFAULT_INVENTORIES: t.Final = {
+    "hikari": "https://www.hikari-py.dev/",
+    "lightbulb": "https://hikari-lightbulb.readthedocs.io/en/latest/",
+    "python": "https://docs.python.org/3/",
+}
+MAX_INVENTORIES: t.Final = 24
+MAX_RESULTS: t.Final = 15
+PREWARM_COUNT: t.Final[int] = Config.get("RTFM_PREWARM_COUNT", 100)
+PREWARM_BATCH_SIZE: t.Final = 32
+REFRESH_INTERVAL: t.Final = 21_600
+RENDER_CACHE_SIZE: t.Final = 512
 
 log = logging.getLogger(__name__)
 
 
-async def refresh_rtfm_cache() -> None:
-    hk = await plugin.bot.d.session.get(HIKARI_DOCS_URL + "objects.inv")
-    plugin.bot.d.hikari_cache = decode_object_inv(await hk.read())
+def _load_registry() -> dict[str, Inventory]:
+    # Inventories are configured as a set of `name=url` entries, for
+    # example: `set:str:aiohttp=https://docs.aiohttp.org/en/stable/`.
+    if entries := Config.get("RTFM_INVENTORIES"):
+        if malformed := [e for e in entries if "=" not in e]:
+            raise ValueError(f"RTFM inventories must be `name=url`, got {malformed}")
+
+        urls = dict(e.split("=", maxsplit=1) for e in entries)
+    else:
+        urls = DEFAULT_INVENTORIES
+
+    # Each inventory becomes an /rtfm subcommand, so names have to be
+    # valid command names, and a group holds at most 25 of them
+    # (including "all").
+    for name in urls:
+        if name != name.lower() or not NAME_REGEX.fullmatch(name):
+            raise ValueError(
+                f"Invalid RTFM inventory name {name!r}: names must be 1-32 "
+                "lowercase letters, digits, hyphens, or underscores"
+            )
+
+    if "all" in urls:
+        raise ValueError("'all' is reserved and cannot be used as an inventory name")
+
+    if len(urls) > MAX_INVENTORIES:
+        raise ValueError(
+            f"Too many RTFM inventories ({len(urls)}): "
+            f"at most {MAX_INVENTORIES} are supported"
+        )
+
+    return {
+        name: Inventory(name, url if url.endswith("/") else f"{url}/")
+        for name, url in sorted(urls.items())
+    }
+
+
+plugin.d.inventories = _load_registry()
+plugin.d.merged = MergedIndex()
+plugin.d.prewarmed = {}
+plugin.d.pending_queries = {}
+
+
+def _index_path(inventory: Inventory) -> Path:
+    return Path(plugin.app.d._dynamic) / "rtfm" / f"{inventory.name}.idx"
+
+
+def load_inventory(inventory: Inventory) -> MappedInventory | None:
+    if not (path := _index_path(inventory)).is_file():
+        return None
+
+    try:
+        return MappedInventory.from_file(path)
+    except (OSError, ValueError) as exc:
+        log.warning(f"Ignoring the stored {inventory.name} RTFM index: {exc}")
+        return None
+
+
+def _build_inventory(stream: bytes, etag: str | None, path: Path) -> MappedInventory:
+    packed = MappedInventory.pack(decode_object_inv(stream), etag)
+
+    try:
+        os.makedirs(path.parent, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        tmp.write_bytes(packed)
+        os.replace(tmp, path)
+        return MappedInventory.from_file(path)
+    except OSError as exc:
+        log.warning(f"Could not store the RTFM index at {path}: {exc}")
+        return MappedInventory(packed)
+
+
+async def fetch_inventory(inventory: Inventory) -> MappedInventory | None:
+    session: ClientSession = plugin.bot.d.session
+    etag = inventory.data.etag
+    headers = {"If-None-Match": etag} if etag else {}
+
+    async with session.get(inventory.url + "objects.inv", headers=headers) as resp:
+        if resp.status == 304:
+            return None
+
+        resp.raise_for_status()
+        stream = await resp.read()
+        etag = resp.headers.get("ETag")
+
+    # Decoding the larger inventories takes long enough to stall the
+    # gateway, so keep it off the event loop.
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        None, _build_inventory, stream, etag, _index_path(inventory)
+    )
+
+
+def _install_inventories(updates: dict[Inventory, MappedInventory]) -> None:
+    # The merged index holds names from every inventory, so new data is
+    # only swapped in alongside the index built from it. Otherwise a
+    # lookup could find a name its inventory no longer has.
+    for inventory, data in updates.items():
+        inventory.data = data
+
+    plugin.d.merged = MergedIndex.from_inventories(plugin.d.inventories.values())
+    plugin.d.prewarmed = {}
+    _render.cache_clear()
+    plugin.app.d.scheduler.add_job(prewarm_rtfm_cache)
+
+
+async def refresh_rtfm_cache(max_age: float = 0) -> None:
+    now = time.time_ns()
+    inventories: list[Inventory] = [
+        inventory
+        for inventory in plugin.d.inventories.values()
+        if now - inventory.data.built_at >= max_age * 1e9
+    ]
+    results = await asyncio.gather(
+        *(fetch_inventory(inventory) for inventory in inventories),
+        return_exceptions=True,
+    )
+    refreshed: dict[Inventory, MappedInventory] = {}
+
+    for inventory, result in zip(inventories, results):
+        if isinstance(result, BaseException):
+            log.error(f"Failed to refresh the {inventory.name} RTFM cache: {result}")
+        elif result is not None:
+            refreshed[inventory] = result
+
+    if refreshed:
+        _install_inventories(refreshed)
+
+    log.info(f"Refreshed {len(refreshed):,} of {len(inventories):,} RTFM caches")
+
+
+def record_query(source: str, query: str, selected: bool) -> None:
+    # Counts are buffered and written in one go by `flush_rtfm_queries`
+    # rather than hitting the database on every command.
+    counts = plugin.d.pending_queries.setdefault((source, query), [0, 0])
+    counts[0] += 1
+    counts[1] += selected
+
+
+async def flush_rtfm_queries() -> None:
+    if not (pending := plugin.d.pending_queries):
+        return
+
+    plugin.d.pending_queries = {}
+    await plugin.app.d.db.executemany(
+        "INSERT INTO rtfm_queries (source, query, queries, selections) "
+        "VALUES (?, ?, ?, ?) "
+        "ON CONFLICT (source, query) DO UPDATE SET "
+        "queries = queries + excluded.queries, "
+        "selections = selections + excluded.selections",
+        *((source, query, *counts) for (source, query), counts in pending.items()),
+    )
+
+
+def _batch_extract(
+    queries: list[str], index: SearchIndex
+) -> dict[str, list[tuple[str, int]]]:
+    results = {}
+
+    for i in range(0, len(queries), PREWARM_BATCH_SIZE):
+        batch = queries[i : i + PREWARM_BATCH_SIZE]
+        scores = process.cdist(batch, index.names, scorer=fuzz.QRatio, dtype=np.float64)
+
+        for query, row in zip(batch, scores):
+            # Order the same way `SearchIndex.search` does: by score,
+            # then by position.
+            kth = np.partition(row, -(k := min(MAX_RESULTS, len(row))))[-k]
+            candidates = np.flatnonzero(row >= kth)
+            best = candidates[np.lexsort((candidates, -row[candidates]))][:k]
+            results[query] = _prioritise(
+                query, [(index.names[position], int(position)) for position in best]
+            )
+
+    return results
+
+
+async def prewarm_rtfm_cache() -> None:
+    cur = await plugin.app.d.db.execute(
+        "SELECT source, query FROM rtfm_queries "
+        "ORDER BY queries + selections DESC "
+        "LIMIT ?",
+        PREWARM_COUNT,
+    )
+    # Queries are whatever users typed, so read them as plain tuples;
+    # the usual row factory would try to parse anything that looks
+    # like a timestamp.
+    cur.row_factory = None
+    queries: dict[str, list[str]] = {}
+
+    for source, query in await cur.fetchall():
+        queries.setdefault(source, []).append(query)
+
+    loop = asyncio.get_running_loop()
+    prewarmed: dict[tuple[str, int, str], list[tuple[str, int]]] = {}
+    sources: list[tuple[Inventory | MergedIndex, list[str]]] = []
+
+    for name, batch in queries.items():
+        source = plugin.d.merged if name == "all" else plugin.d.inventories.get(name)
+
+        if source is None or not len(source.index):
+            continue
+
+        # Results are keyed by the version they were computed against,
+        # so an inventory replaced mid-way can't be served stale data.
+        results = await loop.run_in_executor(None, _batch_extract, batch, source.index)
+        prewarmed.update(
+            ((source.name, source.version, query), value)
+            for query, value in results.items()
+        )
+        sources.append((source, batch))
 
-    lb = await plugin.bot.d.session.get(LIGHTBULB_DOCS_URL + "objects.inv")
-    plugin.bot.d.lightbulb_cache = decode_object_inv(await lb.read())
+    plugin.d.prewarmed = prewarmed
 
-    py = await plugin.bot.d.session.get(PYTHON_DOCS_URL + "objects.inv")
-    plugin.bot.d.python_cache = decode_object_inv(await py.read())
+    for source, batch in sources:
+        for query in batch:
+            render_rtfm(query, source)
 
-    log.info(f"Refreshed all RTFM caches.")
+    log.info(f"Prewarmed {len(prewarmed):,} RTFM queries")
 
 
 @plugin.listener(hikari.StartedEvent)
 async def on_started(_: hikari.StartedEvent) -> None:
-    await refresh_rtfm_cache()
+    # Stored indexes are usable straight away, so only inventories that
+    # are missing or due a refresh need fetching on boot.
+    stored = {
+        inventory: data
+        for inventory in plugin.d.inventories.values()
+        if (data := load_inventory(inventory)) is not None
+    }
+
+    if stored:
+        _install_inventories(stored)
+        log.info(f"Loaded {len(stored):,} stored RTFM caches")
+
+    await refresh_rtfm_cache(max_age=REFRESH_INTERVAL)
 
     plugin.app.d.scheduler.add_job(
         refresh_rtfm_cache, CronTrigger(hour="0,6,12,18", minute=0, second=0)
     )
+    plugin.app.d.scheduler.add_job(flush_rtfm_queries, CronTrigger(second=50))
 
 
-async def get_rtfm(value: str, cache: CachedObjT) -> list[str]:
-    extracted = process.extract(value, cache.keys(), scorer=fuzz.QRatio, limit=15)
+def _prioritise(value: str, extracted: list[tuple[str, int]]) -> list[tuple[str, int]]:
     matches = []
     pure_matches = []
-    for result, _, _ in extracted:
+
+    for result, position in extracted:
         if value in result:
-            pure_matches.append(result)
+            pure_matches.append((result, position))
         else:
-            matches.append(result)
+            matches.append((result, position))
+
     return pure_matches + matches
 
 
-async def build_rtfm_output(query: str, cache: CachedObjT, url: str) -> hikari.Embed:
-    matches = await get_rtfm(query, cache)
-    description = []
+def _extract(value: str, source: Inventory | MergedIndex) -> list[tuple[str, int]]:
+    key = (source.name, source.version, value)
+
+    if (prewarmed := plugin.d.prewarmed.get(key)) is not None:
+        return t.cast(list[tuple[str, int]], prewarmed)
+
+    return _prioritise(value, source.index.search(value, MAX_RESULTS))
+
+
+def _resolve_label(value: str) -> tuple[str, Inventory] | None:
+    if (match := TAG_REGEX.fullmatch(value)) is None:
+        return None
+
+    name, source = match.groups()
+
+    if (inventory := plugin.d.inventories.get(source)) and name in inventory:
+        return name, inventory
+
+    return None
+
 
-    for match in matches:
-        if match in cache:
-            if cache[match].link[-1:] == "$":
-                description.append(
-                    f"[`{match}`]({url}{cache[match].link[:-1] + cache[match].direct})"
-                )
-            else:
-                description.append(f"[`{match}`]({url}{cache[match].link})")
+def _search_merged(value: str, index: MergedIndex) -> list[tuple[str, Inventory]]:
+    if (selected := _resolve_label(value)) is not None:
+        # This is a label picked from the autocomplete, so make sure the
+        # tagged object comes first, whatever the other projects score.
+        return [selected] + [
+            result
+            for result in _search_merged(selected[0], index)
+            if result != selected
+        ][: MAX_RESULTS - 1]
+
+    return [
+        (result, index.source_of(position))
+        for result, position in _extract(value, index)
+    ]
+
+
+@functools.lru_cache(maxsize=RENDER_CACHE_SIZE)
+def _render(
+    source: Inventory | MergedIndex, version: int, query: str
+) -> RenderedResult:
+    # The version only takes part in the key, so results rendered
+    # against an inventory that has since been replaced are never hit.
+    if isinstance(source, MergedIndex):
+        results = _search_merged(query, source)
+        return RenderedResult(
+            tuple(f"{match} ({inventory.name})" for match, inventory in results),
+            "\n".join(
+                f"[`{match}`]({inventory.resolve(match)}) ({inventory.name})"
+                for match, inventory in results
+            ),
+        )
+
+    matches = [result for result, _ in _extract(query, source)]
+    return RenderedResult(
+        tuple(matches),
+        "\n".join(f"[`{match}`]({source.resolve(match)})" for match in matches),
+    )
+
+
+def render_rtfm(query: str, source: Inventory | MergedIndex) -> RenderedResult:
+    return _render(source, source.version, query)
+
+
+async def get_rtfm(value: str, inventory: Inventory) -> list[str]:
+    return list(render_rtfm(value, inventory).choices)
+
+
+async def get_merged_rtfm(value: str, index: MergedIndex) -> list[str]:
+    return list(render_rtfm(value, index).choices)
+
+
+def _build_embed(description: str) -> hikari.Embed:
     return hikari.Embed(
         title="RTFM",
-        description="\n".join(description),
+        description=description,
         color=helpers.choose_colour(),
         timestamp=chron.aware_now(),
     )
 
 
-@plugin.command
-@lightbulb.command(
-    "rtfm", description="Searches the docs of hikari, lightbulb and python."
-)
-@lightbulb.implements(lightbulb.SlashCommandGroup)
-async def rtfm_group(_: lightbulb.SlashContext) -> None:
-    pass
+async def build_rtfm_output(query: str, inventory: Inventory) -> hikari.Embed:
+    return _build_embed(render_rtfm(query, inventory).description)
 
 
-@rtfm_group.child
-@lightbulb.option("query", "The query to search for", autocomplete=True, required=True)
-@lightbulb.command(
-    "hikari", description="Searches the docs of hikari.", auto_defer=True
-)
-@lightbulb.implements(lightbulb.SlashSubCommand)
-async def hikari_rtfm(ctx: lightbulb.SlashContext) -> None:
-    embed = await build_rtfm_output(
-        ctx.options.query, plugin.bot.d.hikari_cache, HIKARI_DOCS_URL
-    )
-    await ctx.respond(embed=embed)
+async def build_merged_rtfm_output(query: str, index: MergedIndex) -> hikari.Embed:
+    return _build_embed(render_rtfm(query, index).description)
 
 
-@rtfm_group.child
-@lightbulb.option("query", "The query to search for", autocomplete=True, required=True)
-@lightbulb.command(
-    "lightbulb", description="Searches the docs of lightbulb.", auto_defer=True
-)
-@lightbulb.implements(lightbulb.SlashSubCommand)
-async def lightbulb_rtfm(ctx: lightbulb.SlashContext) -> None:
-    embed = await build_rtfm_output(
-        ctx.options.query, plugin.bot.d.lightbulb_cache, LIGHTBULB_DOCS_URL
-    )
-    await ctx.respond(embed=embed)
+def _describe_group() -> str:
+    names = string.list_of(list(plugin.d.inventories.keys()))
+    description = f"Searches the docs of {names}."
+
+    # Slash command descriptions are capped at 100 characters.
+    return description if len(description) <= 100 else "Searches the docs."
+
+
+@plugin.command
+@lightbulb.command("rtfm", description=_describe_group())
+@lightbulb.implements(lightbulb.SlashCommandGroup)
+async def rtfm_group(_: lightbulb.SlashContext) -> None:
+    pass
 
 
 @rtfm_group.child
 @lightbulb.option("query", "The query to search for", autocomplete=True, required=True)
 @lightbulb.command(
-    "python", description="Searches the docs of python.", auto_defer=True
+    "all", description="Searches the docs of every project at once.", auto_defer=True
 )
 @lightbulb.implements(lightbulb.SlashSubCommand)
-async def python_rtfm(ctx: lightbulb.SlashContext) -> None:
-    embed = await build_rtfm_output(
-        ctx.options.query, plugin.bot.d.python_cache, PYTHON_DOCS_URL
-    )
+async def all_rtfm(ctx: lightbulb.SlashContext) -> None:
+    query = ctx.options.query
+    embed = await build_merged_rtfm_output(query, plugin.d.merged)
     await ctx.respond(embed=embed)
 
-
-@hikari_rtfm.autocomplete("query")
-async def hikari_autocomplete(
-    opt: hikari.AutocompleteInteractionOption, _: hikari.AutocompleteInteraction
-) -> list[str]:
-    assert isinstance(opt.value, str)
-    return await get_rtfm(opt.value, plugin.bot.d.hikari_cache)
+    record_query("all", query, _resolve_label(query) is not None)
 
 
-@lightbulb_rtfm.autocomplete("query")
-async def lightbulb_autocomplete(
+@all_rtfm.autocomplete("query")
+async def all_autocomplete(
     opt: hikari.AutocompleteInteractionOption, _: hikari.AutocompleteInteraction
 ) -> list[str]:
     assert isinstance(opt.value, str)
-    return await get_rtfm(opt.value, plugin.bot.d.lightbulb_cache)
+    return await get_merged_rtfm(opt.value, plugin.d.merged)
 
 
-@python_rtfm.autocomplete("query")
-async def python_autocomplete(
-    opt: hikari.AutocompleteInteractionOption, _: hikari.AutocompleteInteraction
-) -> list[str]:
-    assert isinstance(opt.value, str)
-    return await get_rtfm(opt.value, plugin.bot.d.python_cache)
+def _add_inventory_command(inventory: Inventory) -> None:
+    @rtfm_group.child
+    @lightbulb.option(
+        "query", "The query to search for", autocomplete=True, required=True
+    )
+    @lightbulb.command(
+        inventory.name,
+        description=f"Searches the docs of {inventory.name}.",
+        auto_defer=True,
+    )
+    @lightbulb.implements(lightbulb.SlashSubCommand)
+    async def inventory_rtfm(ctx: lightbulb.SlashContext) -> None:
+        query = ctx.options.query
+        embed = await build_rtfm_output(query, inventory)
+        await ctx.respond(embed=embed)
+        record_query(inventory.name, query, query in inventory)
+
+    @inventory_rtfm.autocomplete("query")
+    async def inventory_autocomplete(
+        opt: hikari.AutocompleteInteractionOption, _: hikari.AutocompleteInteraction
+    ) -> list[str]:
+        assert isinstance(opt.value, str)
+        return await get_rtfm(opt.value, inventory)
+
+
+for _inventory in plugin.d.inventories.values():
+    _add_inventory_command(_inventory)
+del _inventory
 
 
 def decode_object_inv(
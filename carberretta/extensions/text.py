@@ -28,7 +28,8 @@
 
 from __future__ import annotations
 
-import io
+import asyncio
+import typing as t
 import unicodedata
 
 import hikari
@@ -38,6 +39,29 @@ from carberretta.utils import chron, helpers, string
 
 plugin = lightbulb.Plugin("Text")
 
+ATTACHMENT_SIZE_LIMIT: t.Final = 1024 * 1024
+
+
+async def _read_attachment(
+    attachment: hikari.Attachment,
+) -> tuple[hikari.Attachment, str | None]:
+    # Discord reports the size up front, but the stream is capped too
+    # in case that's wrong.
+    if attachment.size > ATTACHMENT_SIZE_LIMIT:
+        return attachment, None
+
+    data = bytearray()
+    async with attachment.stream() as reader:
+        async for chunk in reader:
+            data += chunk
+            if len(data) > ATTACHMENT_SIZE_LIMIT:
+                return attachment, None
+
+    try:
+        return attachment, data.decode("utf-8")
+    except UnicodeDecodeError:
+        return attachment, None
+
 
 @plugin.command
 @lightbulb.option("characters", "The characters to get the information on.")
@@ -105,48 +129,32 @@ async def cmd_binify(ctx: lightbulb.SlashContext) -> None:
         )
         return
 
-    if message.attachments:
-        data = io.BytesIO(await message.attachments[0].read())
-        file_contents = data.read().decode(encoding="utf-8")
-    else:
-        file_contents = ""
-
-    if message.content:
-        content = (
-            await string.binify(
-                ctx.bot.d.session,
-                message.content,
-                "support",
-                only_codeblocks=True,
-                expires_in_days=expires,
-            )
-            + "\n\n"
-        )
-    else:
-        content = ""
-
-    if file_contents:
-        filename = message.attachments[0].filename
-        extension = filename.split(".")[-1]
-
-        if filename == extension:
-            extension = ""
-
-        file = await string.binify(
-            ctx.bot.d.session,
-            file_contents,
-            "support",
-            only_codeblocks=False,
-            expires_in_days=expires,
-            file_extension=f".{extension}",
-        )
-    else:
-        file = ""
+    results = await asyncio.gather(*map(_read_attachment, message.attachments))
+    attachments = [(a.filename, body) for a, body in results if body is not None]
+    skipped = [f"`{a.filename}`" for a, body in results if body is None]
 
-    await ctx.respond(
-        f"**{string.possessive(message.author)} message:**\n{content}{file}"
+    if not message.content and not attachments:
+        await ctx.respond("There's nothing in that message that can be binified.")
+        return
+
+    content = await string.binify(
+        ctx.bot.d.session,
+        message.content or "",
+        "support",
+        only_codeblocks=True,
+        expires_in_days=expires,
+        attachments=attachments,
+        db=ctx.bot.d.db,
     )
 
+    if skipped:
+        content += (
+            f"\n\nSkipped {string.list_of(skipped)} (not text, or larger than "
+            f"{ATTACHMENT_SIZE_LIMIT // 1024:,} KiB)."
+        )
+
+    await ctx.respond(f"**{string.possessive(message.author)} message:**\n{content}")
+
 
 def load(bot: lightbulb.BotApp) -> None:
     bot.add_plugin(plugin)
@@ -29,30 +29,54 @@
 from __future__ import annotations
 
 import asyncio
+import collections
+import contextlib
+import datetime as dt
+import heapq
+import json
 import logging
+import math
+import time
 import typing as t
+from xml.etree import ElementTree  # nosec B405
 
+import aiohttp
 import hikari
 import isodate
 import lightbulb
-import rapidfuzz as rf
 from apscheduler.triggers.cron import CronTrigger
-from scrapetube.scrapetube import get_videos
 
 from carberretta import Config
 from carberretta.utils import chron, helpers
 
-if t.TYPE_CHECKING:
-    from aiohttp import ClientSession
-
 plugin = lightbulb.Plugin("YouTube", include_datastore=True)
 log = logging.getLogger(__name__)
 
 BROWSE_ENDPOINT = "https://www.youtube.com/youtubei/v1/browse"
+BROWSE_HEADERS: t.Final = {
+    "Accept-Language": "en",
+    "Cookie": "CONSENT=YES+cb",
+    "User-Agent": (
+        "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 "
+        "(KHTML, like Gecko) Chrome/114.0.0.0 Safari/537.36"
+    ),
+}
+BROWSE_CONCURRENCY: t.Final = 2
+BROWSE_PAGE_DELAY: t.Final = 1
+BROWSE_RETRIES: t.Final = 3
+BROWSE_TIMEOUT: t.Final = aiohttp.ClientTimeout(total=20)
 CHANNELS_URL = (
     "https://www.googleapis.com/youtube/v3/channels"
     "?part=brandingSettings%2Csnippet%2Cstatistics"
 )
+FEED_NAMESPACES: t.Final = {
+    "atom": "http://www.w3.org/2005/Atom",
+    "yt": "http://www.youtube.com/xml/schemas/2015",
+}
+FEED_URL = (
+    "https://www.youtube.com/feeds/videos.xml"
+    f"?channel_id={Config.YOUTUBE_CHANNEL_ID}"
+)
 LIST_URL = "https://www.youtube.com/playlist?list="
 MINE_URL = f"https://www.youtube.com/channel/{Config.YOUTUBE_CHANNEL_ID}"
 PLAYLISTS_URL = (
@@ -64,85 +88,700 @@ VIDEOS_URL = (
 )
 WATCH_URL = "https://www.youtube.com/watch?v="
 
+# Each list call costs one quota unit regardless of the parts requested.
+API_CACHE_SIZE: t.Final = 1_024
+API_ENDPOINTS: t.Final = {
+    # endpoint: (ttl, stale ttl, units per call)
+    "channels": (600, 3_600, 1),
+    "playlists": (1_800, 21_600, 1),
+    "videos": (600, 3_600, 1),
+}
+FEED_ANNOUNCE_CHANNEL_ID: t.Final = Config.get("YOUTUBE_ANNOUNCE_CHANNEL_ID")
+FEED_CHUNK_SIZE: t.Final = 4_096
+# The default project quota is 10,000 units a day. The bucket refills at
+# the budget spread evenly over a day, so one busy evening cannot spend
+# everything up front.
+QUOTA_BUDGET: t.Final = Config.get("YOUTUBE_QUOTA_BUDGET", 9_000)
+QUOTA_BURST: t.Final = Config.get("YOUTUBE_QUOTA_BURST", 100)
+# Quotas reset at midnight Pacific Time. A fixed offset saves depending
+# on tzdata at the cost of being an hour out during daylight saving.
+QUOTA_TIMEZONE: t.Final = dt.timezone(dt.timedelta(hours=-8))
+# The videos endpoint accepts up to 50 IDs per call, so refreshing the
+# whole directory hourly costs well under 1% of the daily quota.
+VIDEO_BATCH_SIZE: t.Final = 50
+
+
+class YouTubeApiError(Exception):
+    def __init__(self, status: int, reason: str | None) -> None:
+        super().__init__(f"The YouTube Data API returned {status}: {reason}.")
+        self.status = status
+        self.reason = reason
+
+
+class QuotaExceededError(Exception):
+    def __init__(self) -> None:
+        super().__init__(
+            "Carberretta is low on YouTube API quota, and nothing is cached for "
+            "that yet. Try again later."
+        )
+
+
+class BrowseError(Exception):
+    pass
+
+
+class QuotaLedger:
+    __slots__ = ("budget", "capacity", "rate", "tokens", "updated", "day", "usage")
+
+    def __init__(self, budget: int, capacity: int) -> None:
+        self.budget = budget
+        self.capacity = capacity
+        self.rate = budget / 86_400
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.day = self.today()
+        self.usage: dict[str, int] = {}
+
+    @property
+    def used(self) -> int:
+        self._roll()
+        return sum(self.usage.values())
+
+    @staticmethod
+    def today() -> str:
+        return dt.datetime.now(QUOTA_TIMEZONE).date().isoformat()
+
+    def _roll(self) -> None:
+        if (today := self.today()) != self.day:
+            self.day = today
+            self.usage = {}
+
+    def refill(self) -> float:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return self.tokens
+
+    def acquire(self, endpoint: str, units: int) -> bool:
+        if self.refill() < units or self.used + units > self.budget:
+            return False
+
+        # Failed calls are still charged, so spend before sending.
+        self.tokens -= units
+        self.usage[endpoint] = self.usage.get(endpoint, 0) + units
+        return True
+
+
+class ApiCache:
+    __slots__ = (
+        "name",
+        "ttl",
+        "stale_ttl",
+        "cost",
+        "max_size",
+        "ledger",
+        "entries",
+        "inflight",
+        "hits",
+        "stale_hits",
+        "misses",
+        "throttled",
+    )
+
+    def __init__(
+        self,
+        name: str,
+        ttl: float,
+        stale_ttl: float,
+        cost: int,
+        max_size: int,
+        ledger: QuotaLedger,
+    ) -> None:
+        self.name = name
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.cost = cost
+        self.max_size = max_size
+        self.ledger = ledger
+        self.entries: dict[str, tuple[float, t.Any]] = {}
+        self.inflight: dict[str, asyncio.Task[t.Any]] = {}
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.throttled = 0
+
+    def __str__(self) -> str:
+        return (
+            f"{self.name}: {self.hits:,} hits, {self.stale_hits:,} stale, "
+            f"{self.misses:,} misses, {self.throttled:,} throttled"
+        )
+
+    async def get(self, key: str, fetch: t.Callable[[], t.Awaitable[t.Any]]) -> t.Any:
+        if (entry := self.entries.get(key)) is not None:
+            age = time.monotonic() - entry[0]
+
+            if age < self.ttl:
+                self.hits += 1
+                return entry[1]
+
+            if age < self.ttl + self.stale_ttl:
+                # Serve what we have and let the next caller see the
+                # refreshed value; a failed refresh keeps the old one.
+                self.stale_hits += 1
+                if key not in self.inflight and self.ledger.acquire(
+                    self.name, self.cost
+                ):
+                    self._fetch(key, fetch).add_done_callback(self._log_failure)
+                return entry[1]
+
+        if key not in self.inflight and not self.ledger.acquire(self.name, self.cost):
+            # Out of quota, so anything we still hold beats an error.
+            self.throttled += 1
+            if entry is None:
+                raise QuotaExceededError()
+            return entry[1]
+
+        self.misses += 1
+        # Shield the shared fetch so one caller being cancelled does not
+        # cancel it for everyone else waiting on the same key.
+        return await asyncio.shield(self._fetch(key, fetch))
+
+    def _fetch(
+        self, key: str, fetch: t.Callable[[], t.Awaitable[t.Any]]
+    ) -> asyncio.Task[t.Any]:
+        if (task := self.inflight.get(key)) is None:
+            task = asyncio.create_task(self._load(key, fetch))
+            task.add_done_callback(lambda _: self.inflight.pop(key, None))
+            self.inflight[key] = task
+
+        return task
+
+    async def _load(self, key: str, fetch: t.Callable[[], t.Awaitable[t.Any]]) -> t.Any:
+        data = await fetch()
+
+        self.entries.pop(key, None)
+        self.entries[key] = (time.monotonic(), data)
+        while len(self.entries) > self.max_size:
+            del self.entries[next(iter(self.entries))]
+
+        return data
+
+    def _log_failure(self, task: asyncio.Task[t.Any]) -> None:
+        if not task.cancelled() and (exc := task.exception()):
+            log.warning(f"Could not revalidate cached {self.name} response: {exc}")
+
+
+class TitleIndex:
+    __slots__ = ("titles", "normalised", "postings")
+
+    # Titles are scored by the longest prefix of the query they contain
+    # as a run. Every 1- to 3-gram maps to the titles containing it, so
+    # finding the titles that contain a run only means intersecting a
+    # few postings and confirming the survivors, not scanning them all.
+    NGRAM_SIZE: t.Final = 3
+
+    def __init__(self, titles: t.Iterable[str]) -> None:
+        self.titles = list(titles)
+        self.normalised = [title.casefold() for title in self.titles]
+        self.postings: dict[str, set[int]] = {}
+
+        for i, title in enumerate(self.normalised):
+            for n in range(1, self.NGRAM_SIZE + 1):
+                for j in range(len(title) - n + 1):
+                    self.postings.setdefault(title[j : j + n], set()).add(i)
+
+    def __len__(self) -> int:
+        return len(self.titles)
+
+    def containing(self, run: str) -> set[int]:
+        if len(run) <= self.NGRAM_SIZE:
+            return self.postings.get(run, set())
+
+        size = self.NGRAM_SIZE
+        postings = sorted(
+            (
+                self.postings.get(run[i : i + size], set())
+                for i in range(len(run) - size + 1)
+            ),
+            key=len,
+        )
+        candidates = postings[0].intersection(*postings[1:])
+        return {i for i in candidates if run in self.normalised[i]}
+
+    def search(self, value: str, limit: int, cutoff: float = 0.5) -> list[str]:
+        if not value:
+            # This will always be empty before the user types any input,
+            # so we should just display everything.
+            return self.titles[:limit]
+
+        query = value.casefold()
+        results: list[int] = []
+        seen: set[int] = set()
+
+        # Walk down from the whole query; every title first found at a
+        # shorter prefix scores lower than those already collected.
+        for length in range(len(query), max(math.ceil(len(query) * cutoff), 1) - 1, -1):
+            if len(results) >= limit:
+                break
+
+            found = self.containing(query[:length]) - seen
+            seen |= found
+            results.extend(heapq.nsmallest(limit - len(results), found))
+
+        return [self.titles[i] for i in results[:limit]]
+
+
+async def _request(url: str) -> dict[str, t.Any]:
+    session: aiohttp.ClientSession = plugin.app.d.session
+
+    async with session.get(url) as resp:
+        if not resp.ok:
+            raise YouTubeApiError(resp.status, resp.reason)
+
+        return t.cast(dict[str, t.Any], await resp.json())
+
+
+async def fetch_resource(endpoint: str, resource_id: str) -> dict[str, t.Any]:
+    url = {
+        "channels": CHANNELS_URL,
+        "playlists": PLAYLISTS_URL,
+        "videos": VIDEOS_URL,
+    }[endpoint] + f"&id={resource_id}&key={Config.YOUTUBE_API_KEY}"
+    cache: ApiCache = plugin.d.api_caches[endpoint]
+    data = await cache.get(resource_id, lambda: _request(url))
+    return t.cast(dict[str, t.Any], data["items"][0])
+
+
+async def prefetch_video_data() -> None:
+    video_ids = list(plugin.d.video_directory.values())
+    cost = API_ENDPOINTS["videos"][2]
+    data: dict[str, dict[str, t.Any]] = {}
+    start = time.perf_counter()
 
-def _similarity(s1: str, s2: str, **_: t.Any) -> float:
-    if not s1:
-        # This will always be empty before the user types any input, so
-        # we should just display everything.
-        return 1.0
+    for i in range(0, len(video_ids), VIDEO_BATCH_SIZE):
+        batch = ",".join(video_ids[i : i + VIDEO_BATCH_SIZE])
+
+        if not plugin.d.quota.acquire("videos", cost):
+            log.warning("Skipping video data prefetch to stay within quota")
+            return
+
+        try:
+            resp = await _request(
+                VIDEOS_URL + f"&id={batch}&key={Config.YOUTUBE_API_KEY}"
+            )
+        except YouTubeApiError as exc:
+            # Keep serving the previous data rather than a partial set.
+            log.error(f"Could not prefetch video data: {exc}")
+            return
 
-    s1, s2 = s1.lower(), s2.lower()
+        data.update((item["id"], item) for item in resp["items"])
 
-    combo = 0
-    max_combo = 0
+    plugin.d.video_data = data
+    log.info(
+        f"Prefetched data for {len(data):,} videos "
+        f"in {(time.perf_counter() - start) * 1_000:,.0f} ms"
+    )
 
-    for char in s2:
-        if char == s1[combo]:
-            combo += 1
-            if combo == len(s1):
-                return 1.0
 
-        else:
-            combo = 0
-            max_combo = max(combo, max_combo)
+async def load_quota_usage() -> None:
+    quota: QuotaLedger = plugin.d.quota
+    rows = await plugin.app.d.db.fetch_records(
+        "SELECT endpoint, units FROM youtube_quota WHERE day = ?", quota.day
+    )
+    quota.usage = {row.endpoint: row.units for row in rows}
 
-    return max_combo / len(s1)
 
+async def flush_quota_usage() -> None:
+    quota: QuotaLedger = plugin.d.quota
 
-def _compile_options(value: str, directory: dict[str, str]) -> list[str]:
-    return [
-        res[0]
-        for res in rf.process.extract(
-            value,
-            directory.keys(),
-            scorer=_similarity,
-            processor=None,
-            limit=25,
-            score_cutoff=0.5,
+    if quota.used:
+        await plugin.app.d.db.executemany(
+            "INSERT INTO youtube_quota VALUES (?, ?, ?) "
+            "ON CONFLICT (day, endpoint) DO UPDATE SET units = excluded.units",
+            *((quota.day, endpoint, units) for endpoint, units in quota.usage.items()),
         )
-    ]
 
 
-def _create_video_directory() -> None:
+def _log_api_cache_stats() -> None:
+    log.info(
+        f"YouTube API usage: {plugin.d.quota.used:,}/{QUOTA_BUDGET:,} units today; "
+        + "; ".join(map(str, plugin.d.api_caches.values()))
+    )
+
+
+def _compile_options(value: str, index: TitleIndex) -> list[str]:
+    return index.search(value, limit=25)
+
+
+def _json_from_html(html: str, key: str, offset: int = 2, stop: str = '"') -> str:
+    if (start := html.find(key)) == -1:
+        raise BrowseError(f"could not find {key!r} in channel page")
+
+    start += len(key) + offset
+    return html[start : html.find(stop, start)]
+
+
+def _search_dict(data: t.Any, key: str) -> t.Iterator[t.Any]:
+    # Breadth first, so items come out in listing order.
+    queue = collections.deque([data])
+
+    while queue:
+        if isinstance(item := queue.popleft(), dict):
+            for k, v in item.items():
+                if k == key:
+                    yield v
+                else:
+                    queue.append(v)
+        elif isinstance(item, list):
+            queue.extend(item)
+
+
+async def _browse_request(method: str, url: str, **kwargs: t.Any) -> str:
+    session: aiohttp.ClientSession = plugin.app.d.session
+
+    async def request() -> str:
+        async with plugin.d.browse_limiter:
+            async with session.request(
+                method, url, timeout=BROWSE_TIMEOUT, **kwargs
+            ) as resp:
+                resp.raise_for_status()
+                return await resp.text()
+
+    # Error statuses are worth retrying here too, as YouTube sometimes
+    # answers a burst of requests with a 429 or 5xx.
+    return await helpers.retry(
+        request,
+        f"Browse request to {url}",
+        retries=BROWSE_RETRIES,
+        errors=(aiohttp.ClientError, asyncio.TimeoutError),
+    )
+
+
+async def browse(url: str, selector: str) -> t.AsyncGenerator[dict[str, t.Any], None]:
+    html = await _browse_request(
+        "GET", url, params={"ucbcb": 1}, headers=BROWSE_HEADERS
+    )
+
+    try:
+        client = json.loads(
+            _json_from_html(html, "INNERTUBE_CONTEXT", 2, '"}},') + '"}}'
+        )["client"]
+        api_key = _json_from_html(html, "innertubeApiKey", 3)
+        data = json.loads(_json_from_html(html, "var ytInitialData = ", 0, "};") + "}")
+        headers = {
+            **BROWSE_HEADERS,
+            "X-YouTube-Client-Name": "1",
+            "X-YouTube-Client-Version": client["clientVersion"],
+        }
+    except (KeyError, ValueError) as exc:
+        raise BrowseError(f"could not parse channel page: {exc}") from exc
+
+    while True:
+        for item in _search_dict(data, selector):
+            yield item
+
+        if (endpoint := next(_search_dict(data, "continuationEndpoint"), None)) is None:
+            return
+
+        await asyncio.sleep(BROWSE_PAGE_DELAY)
+        text = await _browse_request(
+            "POST",
+            BROWSE_ENDPOINT,
+            params={"key": api_key},
+            headers=headers,
+            json={
+                "context": {
+                    "clickTracking": {
+                        "clickTrackingParams": endpoint["clickTrackingParams"]
+                    },
+                    "client": client,
+                },
+                "continuation": endpoint["continuationCommand"]["token"],
+            },
+        )
+
+        try:
+            data = json.loads(text)
+        except ValueError as exc:
+            raise BrowseError(f"could not parse continuation: {exc}") from exc
+
+
+async def _scrape_videos(known: set[str]) -> list[tuple[str, str]]:
     url = f"{MINE_URL}/videos?view=0&sort=dd&flow=grid"
-    items = get_videos(url, BROWSE_ENDPOINT, f"richItemRenderer", None, 1)
+    items: list[tuple[str, str]] = []
 
-    plugin.d["video_directory"] = {
-        (v := x["content"]["videoRenderer"])["title"]["runs"][0]["text"]: v["videoId"]
-        for x in items
-    }
+    async with contextlib.aclosing(browse(url, "richItemRenderer")) as listing:
+        async for x in listing:
+            if (v := x["content"]["videoRenderer"])["videoId"] in known:
+                break
+
+            items.append((v["videoId"], v["title"]["runs"][0]["text"]))
 
-    log.info(f"Updated video directory ({len(plugin.d['video_directory'])} videos)")
+    return items
 
 
-def _create_playlist_directory() -> None:
+async def _scrape_playlists(known: set[str]) -> list[tuple[str, str]]:
     url = f"{MINE_URL}/playlists?view=0&sort=dd&flow=grid"
-    items = get_videos(url, BROWSE_ENDPOINT, f"gridPlaylistRenderer", None, 1)
+    items: list[tuple[str, str]] = []
 
-    plugin.d["playlist_directory"] = {
-        x["title"]["runs"][0]["text"]: x[f"playlistId"] for x in items
-    }
+    async with contextlib.aclosing(browse(url, "gridPlaylistRenderer")) as listing:
+        async for x in listing:
+            if x["playlistId"] in known:
+                break
+
+            items.append((x["playlistId"], x["title"]["runs"][0]["text"]))
+
+    return items
+
+
+def _build_directory(rows: t.Iterable[tuple[str, str]]) -> dict[str, str]:
+    directory: dict[str, str] = {}
+
+    for resource_id, title in rows:
+        if title in directory:
+            # The newest upload keeps the bare title. Discord caps
+            # choices at 100 characters, so trim to fit the ID.
+            suffix = f" ({resource_id})"
+            title = title[: 100 - len(suffix)] + suffix
+
+        directory[title] = resource_id
+
+    return directory
+
+
+async def load_directory(kind: str) -> None:
+    rows = await plugin.app.d.db.fetch_records(
+        f"SELECT {kind}_id, title FROM youtube_{kind}s "  # nosec B608
+        "ORDER BY position DESC"
+    )
+    directory = _build_directory((row[f"{kind}_id"], row.title) for row in rows)
+    plugin.d[f"{kind}_index"] = TitleIndex(directory)
+    plugin.d[f"{kind}_directory"] = directory
+
+
+async def store_directory_items(
+    kind: str, items: list[tuple[str, str]], full: bool = False
+) -> None:
+    # Items are newest first, and are placed above everything already
+    # stored unless this is a full resync.
+    db = plugin.app.d.db
+    synced_at = time.time_ns()
+    top = 0
+
+    if not full:
+        row = await db.try_fetch_record(
+            "SELECT COALESCE(MAX(position), 0) AS top "  # nosec B608
+            f"FROM youtube_{kind}s"
+        )
+        top = row.top
+
+    await db.executemany(
+        f"INSERT INTO youtube_{kind}s VALUES (?, ?, ?, ?) "  # nosec B608
+        f"ON CONFLICT ({kind}_id) DO UPDATE SET title = excluded.title, "
+        "position = excluded.position, synced_at = excluded.synced_at",
+        *(
+            (resource_id, title, top + len(items) - i, synced_at)
+            for i, (resource_id, title) in enumerate(items)
+        ),
+    )
+
+    if full:
+        await db.execute(
+            f"DELETE FROM youtube_{kind}s WHERE synced_at != ?",  # nosec B608
+            synced_at,
+        )
+
+    await load_directory(kind)
+
+
+async def refresh_directory(kind: str, full: bool = False) -> None:
+    # The listing is newest first, so a regular refresh stops at the
+    # first ID we already have. A full resync also picks up renamed and
+    # removed uploads.
+    lock: asyncio.Lock = plugin.d.directory_locks[kind]
+    if lock.locked() and not full:
+        # A resync is already running and will cover this anyway.
+        return
+
+    scrape = {"video": _scrape_videos, "playlist": _scrape_playlists}[kind]
+    start = time.perf_counter()
+
+    # Refreshes and resyncs both rewrite positions, so one at a time.
+    async with lock:
+        known = set() if full else set(plugin.d[f"{kind}_directory"].values())
+
+        try:
+            items = await scrape(known)
+        except (aiohttp.ClientError, asyncio.TimeoutError, BrowseError) as exc:
+            log.error(
+                f"Could not refresh {kind} directory after "
+                f"{(time.perf_counter() - start) * 1_000:,.0f} ms: {exc!r}"
+            )
+            return
+
+        if items:
+            await store_directory_items(kind, items, full)
 
     log.info(
-        f"Updated playlist directory ({len(plugin.d['playlist_directory'])} playlists)"
+        f"{'Resynced' if full else 'Refreshed'} {kind} directory "
+        f"({len(items):,} new or updated, {len(plugin.d[f'{kind}_directory']):,} "
+        f"total) in {(time.perf_counter() - start) * 1_000:,.0f} ms"
+    )
+
+    if kind == "video" and (items or not plugin.d.video_data):
+        await prefetch_video_data()
+
+
+async def _read_feed_delta(
+    resp: aiohttp.ClientResponse, known: set[str]
+) -> list[tuple[str, str]]:
+    # Entries are newest first, so stop reading (and parsing) at the
+    # first video we already have.
+    parser = ElementTree.XMLPullParser(events=("end",))  # nosec B314
+    entry_tag = f"{{{FEED_NAMESPACES['atom']}}}entry"
+    items: list[tuple[str, str]] = []
+
+    async for chunk in resp.content.iter_chunked(FEED_CHUNK_SIZE):
+        parser.feed(chunk)
+
+        for _, element in parser.read_events():
+            if element.tag != entry_tag:
+                continue
+
+            video_id = element.findtext("yt:videoId", "", FEED_NAMESPACES)
+            if video_id in known:
+                return items
+
+            items.append(
+                (video_id, element.findtext("atom:title", "", FEED_NAMESPACES))
+            )
+            element.clear()
+
+    return items
+
+
+async def _announce_upload(video_id: str, title: str) -> None:
+    await plugin.app.rest.create_message(
+        FEED_ANNOUNCE_CHANNEL_ID,
+        f"**{title}** is now live on the channel!\n{WATCH_URL + video_id}",
     )
 
 
+async def poll_upload_feed() -> None:
+    session: aiohttp.ClientSession = plugin.app.d.session
+    known = set(plugin.d.video_directory.values())
+    start = time.perf_counter()
+
+    try:
+        async with session.get(
+            FEED_URL, headers=plugin.d.feed_validators, timeout=BROWSE_TIMEOUT
+        ) as resp:
+            if resp.status == 304:
+                return
+
+            resp.raise_for_status()
+            items = await _read_feed_delta(resp, known)
+            plugin.d.feed_validators = {
+                header: resp.headers[key]
+                for key, header in (
+                    ("ETag", "If-None-Match"),
+                    ("Last-Modified", "If-Modified-Since"),
+                )
+                if key in resp.headers
+            }
+    except (aiohttp.ClientError, asyncio.TimeoutError, ElementTree.ParseError) as exc:
+        log.warning(f"Could not poll the upload feed: {exc!r}")
+        return
+
+    if not items:
+        return
+
+    async with plugin.d.directory_locks["video"]:
+        await store_directory_items("video", items)
+
+    log.info(
+        f"Found {len(items):,} new uploads in the feed "
+        f"in {(time.perf_counter() - start) * 1_000:,.0f} ms"
+    )
+
+    # The feed also carries uploads the videos listing doesn't (shorts
+    # and streams), which every full resync removes again. Announcing
+    # only IDs the feed has never shown before stops those coming back
+    # around each day.
+    db = plugin.app.d.db
+    rows = await db.fetch_records(
+        "SELECT video_id FROM youtube_feed_seen "  # nosec B608
+        f"WHERE video_id IN ({', '.join('?' * len(items))})",
+        *(video_id for video_id, _ in items),
+    )
+    seen = {row.video_id for row in rows}
+    await db.executemany(
+        "INSERT OR IGNORE INTO youtube_feed_seen VALUES (?, ?)",
+        *((video_id, time.time()) for video_id, _ in items),
+    )
+
+    # With nothing known yet, these are not new uploads, just the first
+    # sync.
+    if known and FEED_ANNOUNCE_CHANNEL_ID:
+        for video_id, title in reversed(items):
+            if video_id not in seen:
+                await _announce_upload(video_id, title)
+
+
 @plugin.listener(hikari.StartedEvent)
 async def on_started(_: hikari.StartedEvent) -> None:
-    log.warning("Video and playlist directories will not be immediately available")
-    loop = asyncio.get_running_loop()
+    plugin.d.quota = QuotaLedger(QUOTA_BUDGET, QUOTA_BURST)
+    await load_quota_usage()
+    plugin.d.api_caches = {
+        endpoint: ApiCache(
+            endpoint, ttl, stale_ttl, cost, API_CACHE_SIZE, plugin.d.quota
+        )
+        for endpoint, (ttl, stale_ttl, cost) in API_ENDPOINTS.items()
+    }
+    plugin.app.d.scheduler.add_job(flush_quota_usage, CronTrigger(second=55))
+    plugin.app.d.scheduler.add_job(
+        _log_api_cache_stats, CronTrigger(hour=0, minute=0, second=0)
+    )
 
-    plugin.d.video_directory = {}
-    loop.run_in_executor(None, _create_video_directory)
+    plugin.d.browse_limiter = asyncio.Semaphore(BROWSE_CONCURRENCY)
+    plugin.d.video_data = {}
+    plugin.d.directory_locks = {"video": asyncio.Lock(), "playlist": asyncio.Lock()}
+    await load_directory("video")
+    await load_directory("playlist")
+
+    if not (plugin.d.video_directory and plugin.d.playlist_directory):
+        log.warning("Video and playlist directories will not be immediately available")
+
+    # Catch up on anything uploaded while the bot was down without
+    # holding up startup.
+    for kind in ("video", "playlist"):
+        plugin.app.d.scheduler.add_job(refresh_directory, args=(kind,))
+
+    plugin.app.d.scheduler.add_job(
+        refresh_directory, CronTrigger(minute=5, second=0), args=("video",)
+    )
+    plugin.app.d.scheduler.add_job(
+        refresh_directory,
+        CronTrigger(hour=12, minute=5, second=0),
+        args=("video",),
+        kwargs={"full": True},
+    )
+    plugin.app.d.scheduler.add_job(
+        prefetch_video_data, CronTrigger(minute=35, second=0)
+    )
+    plugin.d.feed_validators = {}
     plugin.app.d.scheduler.add_job(
-        _create_video_directory, CronTrigger(hour=12, minute=5, second=0)
+        poll_upload_feed, CronTrigger(minute="*/5", second=15)
     )
 
-    plugin.d.playlist_directory = {}
-    loop.run_in_executor(None, _create_playlist_directory)
     plugin.app.d.scheduler.add_job(
-        _create_playlist_directory, CronTrigger(hour=0, minute=0, second=0)
+        refresh_directory, CronTrigger(minute=10, second=0), args=("playlist",)
+    )
+    plugin.app.d.scheduler.add_job(
+        refresh_directory,
+        CronTrigger(hour=0, minute=0, second=0),
+        args=("playlist",),
+        kwargs={"full": True},
     )
 
 
@@ -179,7 +818,7 @@ async def cmd_youtube_video_link_autocomplete(
     opt: hikari.AutocompleteInteractionOption, _: hikari.AutocompleteInteraction
 ) -> list[str]:
     assert isinstance(opt.value, str)
-    return _compile_options(opt.value, plugin.d.video_directory)
+    return _compile_options(opt.value, plugin.d.video_index)
 
 
 @cmd_youtube_video.child
@@ -195,18 +834,15 @@ async def cmd_youtube_video_information(ctx: lightbulb.SlashContext) -> None:
         return
 
     video_id = plugin.d.video_directory[ctx.options.title]
-    url = VIDEOS_URL + f"&id={video_id}&key={Config.YOUTUBE_API_KEY}"
-    session: ClientSession = plugin.app.d.session
 
-    async with session.get(url) as resp:
-        if not resp.ok:
-            await ctx.respond(
-                f"The YouTube Data API returned {resp.status}: {resp.reason}."
-            )
+    # Only videos published since the last prefetch need a live call.
+    if (data := plugin.d.video_data.get(video_id)) is None:
+        try:
+            data = await fetch_resource("videos", video_id)
+        except (YouTubeApiError, QuotaExceededError) as exc:
+            await ctx.respond(str(exc))
             return
 
-        data = (await resp.json())["items"][0]
-
     thumbnails: dict[str, dict[str, str]] = data["snippet"]["thumbnails"]
     published = int(isodate.parse_datetime(data["snippet"]["publishedAt"]).timestamp())
 
@@ -247,7 +883,7 @@ async def cmd_youtube_video_information_autocomplete(
     opt: hikari.AutocompleteInteractionOption, _: hikari.AutocompleteInteraction
 ) -> list[str]:
     assert isinstance(opt.value, str)
-    return _compile_options(opt.value, plugin.d.video_directory)
+    return _compile_options(opt.value, plugin.d.video_index)
 
 
 # PLAYLIST COMMANDS ----------------------------------------------------
@@ -276,7 +912,7 @@ async def cmd_youtube_playlist_link_autocomplete(
     opt: hikari.AutocompleteInteractionOption, _: hikari.AutocompleteInteraction
 ) -> list[str]:
     assert isinstance(opt.value, str)
-    return _compile_options(opt.value, plugin.d.playlist_directory)
+    return _compile_options(opt.value, plugin.d.playlist_index)
 
 
 @cmd_youtube_playlist.child
@@ -292,17 +928,12 @@ async def cmd_youtube_playlist_information(ctx: lightbulb.SlashContext) -> None:
         return
 
     playlist_id = plugin.d.playlist_directory[ctx.options.title]
-    url = PLAYLISTS_URL + f"&id={playlist_id}&key={Config.YOUTUBE_API_KEY}"
-    session: ClientSession = plugin.app.d.session
-
-    async with session.get(url) as resp:
-        if not resp.ok:
-            await ctx.respond(
-                f"The YouTube Data API returned {resp.status}: {resp.reason}."
-            )
-            return
 
-        data = (await resp.json())["items"][0]
+    try:
+        data = await fetch_resource("playlists", playlist_id)
+    except (YouTubeApiError, QuotaExceededError) as exc:
+        await ctx.respond(str(exc))
+        return
 
     thumbnails: dict[str, dict[str, str]] = data["snippet"]["thumbnails"]
     published = int(isodate.parse_datetime(data["snippet"]["publishedAt"]).timestamp())
@@ -332,7 +963,7 @@ async def cmd_youtube_playlist_information_autocomplete(
     opt: hikari.AutocompleteInteractionOption, _: hikari.AutocompleteInteraction
 ) -> list[str]:
     assert isinstance(opt.value, str)
-    return _compile_options(opt.value, plugin.d.playlist_directory)
+    return _compile_options(opt.value, plugin.d.playlist_index)
 
 
 # CHANNEL COMMANDS -----------------------------------------------------
@@ -345,17 +976,11 @@ async def cmd_youtube_channel(ctx: lightbulb.SlashContext) -> None:
     if not (member := ctx.member):
         return
 
-    url = CHANNELS_URL + f"&id={Config.YOUTUBE_CHANNEL_ID}&key={Config.YOUTUBE_API_KEY}"
-    session: ClientSession = plugin.app.d.session
-
-    async with session.get(url) as resp:
-        if not resp.ok:
-            await ctx.respond(
-                f"The YouTube Data API returned {resp.status}: {resp.reason}."
-            )
-            return
-
-        data = (await resp.json())["items"][0]
+    try:
+        data = await fetch_resource("channels", Config.YOUTUBE_CHANNEL_ID)
+    except (YouTubeApiError, QuotaExceededError) as exc:
+        await ctx.respond(str(exc))
+        return
 
     latest_title, latest_id = (
         next(iter(plugin.d.video_directory.items()))
@@ -385,6 +1010,41 @@ async def cmd_youtube_channel(ctx: lightbulb.SlashContext) -> None:
     )
 
 
+# QUOTA COMMANDS -------------------------------------------------------
+
+
+@plugin.command
+@lightbulb.add_checks(lightbulb.owner_only)
+@lightbulb.command("quota", "View YouTube API quota usage.", ephemeral=True)
+@lightbulb.implements(lightbulb.SlashCommand)
+async def cmd_quota(ctx: lightbulb.SlashContext) -> None:
+    quota: QuotaLedger = plugin.d.quota
+    used = quota.used
+    tokens = quota.refill()
+
+    await ctx.respond(
+        hikari.Embed(
+            title="YouTube API quota",
+            description=(
+                f"{used:,} of {quota.budget:,} units used today "
+                f"({used / quota.budget:.1%}), {tokens:,.1f} of "
+                f"{quota.capacity:,} burst tokens available."
+            ),
+            colour=helpers.choose_colour(),
+            timestamp=chron.aware_now(),
+        )
+        .add_field(
+            "By endpoint",
+            "\n".join(
+                f"{endpoint}: {units:,}"
+                for endpoint, units in sorted(quota.usage.items())
+            )
+            or "Nothing yet",
+        )
+        .add_field("Cache", "\n".join(map(str, plugin.d.api_caches.values())))
+    )
+
+
 def load(bot: lightbulb.BotApp) -> None:
     bot.add_plugin(plugin)
 
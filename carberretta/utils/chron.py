@@ -35,6 +35,16 @@ def aware_now() -> dt.datetime:
     return dt.datetime.now().astimezone()
 
 
+def parse_moment(value: str) -> dt.datetime:
+    # Either an ISO 8601 timestamp (local time unless an offset is
+    # given), or an ISO 8601 duration counting back from now.
+    if value.upper().startswith("P"):
+        moment: dt.datetime = aware_now() - parse_duration(value.upper())
+        return moment
+
+    return dt.datetime.fromisoformat(value).astimezone()
+
+
 def nat_delta(delta: dt.timedelta | int | float | str, ms: bool = False) -> str:
     if isinstance(delta, (int, float)):
         delta = dt.timedelta(seconds=delta)
@@ -26,12 +26,40 @@
 # OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+import asyncio
+import atexit
 import hashlib
 import logging
 import random
 import time
+import typing as t
 import warnings
-from io import StringIO
+from pathlib import Path
+
+import aiohttp
+import hikari
+
+from carberretta.utils.logs import (
+    BoundedQueueHandler,
+    BoundedQueueListener,
+    LevelFormatter,
+    LogArchive,
+    LogStore,
+    LogStoreHandler,
+)
+
+T = t.TypeVar("T")
+
+# Failures worth another go: dropped connections, timeouts, and Discord
+# having a bad moment.
+TRANSIENT_ERRORS: t.Final = (
+    aiohttp.ClientConnectionError,
+    asyncio.TimeoutError,
+    hikari.InternalServerError,
+    hikari.RateLimitTooLongError,
+)
+
+log = logging.getLogger(__name__)
 
 
 def choose_colour() -> int:
@@ -65,7 +93,34 @@ def generate_id() -> str:
     return hashlib.md5(f"{time.time()}".encode(), usedforsecurity=False).hexdigest()
 
 
-def configure_logging(level: int = logging.INFO) -> StringIO:
+async def retry(
+    func: t.Callable[[], t.Awaitable[T]],
+    what: str,
+    *,
+    retries: int = 3,
+    errors: tuple[type[BaseException], ...] = TRANSIENT_ERRORS,
+) -> T:
+    attempt = 0
+
+    while True:
+        attempt += 1
+
+        try:
+            return await func()
+        except errors as exc:
+            if attempt == retries:
+                raise
+
+            log.warning(
+                f"{what} failed ({type(exc).__name__}), "
+                f"retrying ({attempt}/{retries - 1})"
+            )
+            await asyncio.sleep(2**attempt)
+
+
+def configure_logging(
+    level: int = logging.INFO, archive_path: Path | None = None
+) -> tuple[LogStore, LogArchive | None]:
     # Hikari doesn't allow for the adding of additional handlers, so
     # we'll just do it ourselves.
 
@@ -78,28 +133,32 @@ def configure_logging(level: int = logging.INFO) -> StringIO:
         logging.CRITICAL: "\33[1m\33[48;5;196m",
     }
 
-    class ConsoleFormatter(logging.Formatter):
-        def format(self, record: logging.LogRecord) -> str:
-            log_fmt = f"{COLOURS[record.levelno]}{FMT}\33[0m"
-            formatter = logging.Formatter(log_fmt, style="{")
-            return formatter.format(record)
-
-    class StringIOFormatter(logging.Formatter):
-        def format(self, record: logging.LogRecord) -> str:
-            formatter = logging.Formatter(FMT, style="{")
-            return formatter.format(record)
-
     console = logging.StreamHandler()
-    console.setFormatter(ConsoleFormatter())
+    console.setFormatter(
+        LevelFormatter(FMT, {lvl: f"{c}{FMT}\33[0m" for lvl, c in COLOURS.items()})
+    )
+    console.setLevel(level)
+
+    store = LogStoreHandler(LogStore())
+    store.setFormatter(LevelFormatter(FMT))
+    handlers: list[logging.Handler] = [console, store]
 
-    string_io = logging.StreamHandler(stream=(stream := StringIO()))
-    string_io.setFormatter(StringIOFormatter())
+    archive = None
+    if archive_path:
+        archive = LogArchive(archive_path)
+        archive.setFormatter(store.formatter)
+        handlers.append(archive)
 
-    logging.basicConfig(
-        level=logging.DEBUG,
-        handlers=[console, string_io],
+    # The event loop only has to queue records; formatting and writing
+    # happen on the listener's thread.
+    handler = BoundedQueueHandler()
+    listener = BoundedQueueListener(
+        handler.queue, *handlers, respect_handler_level=True
     )
-    console.setLevel(level)
+    listener.start()
+    atexit.register(listener.stop)
+
+    logging.basicConfig(level=logging.DEBUG, handlers=[handler])
 
     # Optimise and set extra options.
     logging.logThreads = False
@@ -107,5 +166,5 @@ def configure_logging(level: int = logging.INFO) -> StringIO:
     warnings.simplefilter("always", DeprecationWarning)
     logging.captureWarnings(True)
 
-    # Return the stream to be accessed later.
-    return stream
+    # Return the store and archive to be accessed later.
+    return store.store, archive
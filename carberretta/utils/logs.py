@@ -0,0 +1,458 @@
+# Copyright (c) 2020-present, Carberra
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+from __future__ import annotations
+
+import bisect
+import collections
+import gzip
+import heapq
+import json
+import logging
+import queue
+import shutil
+import threading
+import typing as t
+import zlib
+from dataclasses import asdict, dataclass, field
+from logging.handlers import QueueHandler, QueueListener
+from operator import attrgetter
+from pathlib import Path
+
+STORE_CAPACITY: t.Final = 10_000
+STORE_BYTE_BUDGET: t.Final = 8 * 1024 * 1024
+QUEUE_SIZE: t.Final = 10_000
+# Arguments of these types can't change before the listener gets to
+# them, so their messages can be formatted off the event loop.
+SETTLED_TYPES: t.Final = (str, int, float, bytes, type(None))
+ARCHIVE_SEGMENT_SIZE: t.Final = 4 * 1024 * 1024
+ARCHIVE_SEGMENTS: t.Final = 250
+ARCHIVE_QUERY_LIMIT: t.Final = 50_000
+
+_created = attrgetter("created")
+
+
+@dataclass(frozen=True, slots=True)
+class LogEntry:
+    seq: int
+    created: float
+    levelno: int
+    text: str
+    size: int
+
+    def __lt__(self, other: LogEntry) -> bool:
+        return self.seq < other.seq
+
+
+class LogStore:
+    __slots__ = (
+        "capacity",
+        "byte_budget",
+        "size",
+        "entries",
+        "levels",
+        "evicted",
+        "_seq",
+        "_lock",
+    )
+
+    def __init__(
+        self, capacity: int = STORE_CAPACITY, byte_budget: int = STORE_BYTE_BUDGET
+    ) -> None:
+        self.capacity = capacity
+        self.byte_budget = byte_budget
+        self.size = 0
+        self.entries: collections.deque[LogEntry] = collections.deque()
+        # Entries leave in the order they arrived, so the oldest entry
+        # of a level is always at the front of that level's index.
+        self.levels: dict[int, collections.deque[LogEntry]] = {}
+        self.evicted: collections.Counter[int] = collections.Counter()
+        self._seq = 0
+        # Records can come from executor threads as well as the loop.
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def append(self, created: float, levelno: int, text: str) -> None:
+        with self._lock:
+            # The budget is in bytes, so count the encoded text.
+            entry = LogEntry(self._seq, created, levelno, text, len(text.encode()))
+            self._seq += 1
+            self.entries.append(entry)
+            self.levels.setdefault(levelno, collections.deque()).append(entry)
+            self.size += entry.size
+
+            while len(self.entries) > self.capacity or (
+                self.size > self.byte_budget and len(self.entries) > 1
+            ):
+                old = self.entries.popleft()
+                self.levels[old.levelno].popleft()
+                self.size -= old.size
+                self.evicted[old.levelno] += 1
+
+    def query(
+        self,
+        min_level: int = logging.NOTSET,
+        since: float | None = None,
+        until: float | None = None,
+    ) -> list[str]:
+        with self._lock:
+            matches = []
+
+            for levelno, index in self.levels.items():
+                if levelno < min_level:
+                    continue
+
+                # Timestamps grow along an index (clock jumps aside),
+                # so the window can be found without scanning.
+                lo = (
+                    0
+                    if since is None
+                    else bisect.bisect_left(index, since, key=_created)
+                )
+                hi = (
+                    len(index)
+                    if until is None
+                    else bisect.bisect_right(index, until, key=_created)
+                )
+                matches.append([index[i] for i in range(lo, hi)])
+
+        return [entry.text for entry in heapq.merge(*matches)]
+
+    @property
+    def oldest(self) -> float | None:
+        return self.entries[0].created if self.entries else None
+
+    def evictions(self, min_level: int = logging.NOTSET) -> int:
+        return sum(n for levelno, n in self.evicted.items() if levelno >= min_level)
+
+
+class LogStoreHandler(logging.Handler):
+    def __init__(self, store: LogStore, level: int = logging.NOTSET) -> None:
+        super().__init__(level)
+        self.store = store
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            self.store.append(record.created, record.levelno, self.format(record))
+        except Exception:
+            self.handleError(record)
+
+
+class LevelFormatter(logging.Formatter):
+    def __init__(self, fmt: str, formats: dict[int, str] | None = None) -> None:
+        super().__init__(fmt, style="{")
+        # Built once up front rather than for every record.
+        self.formatters = {
+            levelno: logging.Formatter(level_fmt, style="{")
+            for levelno, level_fmt in (formats or {}).items()
+        }
+
+    def format(self, record: logging.LogRecord) -> str:
+        if formatter := self.formatters.get(record.levelno):
+            return formatter.format(record)
+
+        return super().format(record)
+
+
+def _settled(args: t.Any) -> bool:
+    values = args.values() if isinstance(args, dict) else args
+    return all(isinstance(arg, SETTLED_TYPES) for arg in values)
+
+
+class BoundedQueueHandler(QueueHandler):
+    queue: queue.Queue[logging.LogRecord | None]
+
+    def __init__(self, size: int = QUEUE_SIZE) -> None:
+        super().__init__(queue.Queue(size))
+        self.dropped: collections.Counter[int] = collections.Counter()
+        self._unreported = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The stdlib formats every record here, on the caller's thread.
+        # Only records whose arguments could still change need that;
+        # everything else (tracebacks included) is formatted later.
+        if record.args and not _settled(record.args):
+            record.msg = record.getMessage()
+            record.args = None
+
+        return record
+
+    def _drop(self, record: logging.LogRecord) -> None:
+        self.dropped[record.levelno] += 1
+        self._unreported += 1
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # Anything below a warning is dropped when the listener
+            # falls behind; more important records push out the oldest
+            # queued one instead.
+            if record.levelno < logging.WARNING:
+                self._drop(record)
+                return
+
+            try:
+                if (oldest := self.queue.get_nowait()) is None:
+                    # Never lose the listener's stop sentinel.
+                    self.queue.put_nowait(oldest)
+                    self._drop(record)
+                    return
+
+                self._drop(oldest)
+                self.queue.put_nowait(record)
+            except (queue.Empty, queue.Full):
+                self._drop(record)
+
+            return
+
+        if self._unreported:
+            summary = logging.makeLogRecord(
+                {
+                    "name": __name__,
+                    "levelno": logging.WARNING,
+                    "levelname": "WARNING",
+                    "msg": f"Dropped {self._unreported:,} log records "
+                    "while the queue was full",
+                }
+            )
+
+            try:
+                self.queue.put_nowait(summary)
+                self._unreported = 0
+            except queue.Full:
+                pass
+
+
+class BoundedQueueListener(QueueListener):
+    queue: queue.Queue[logging.LogRecord | None]
+
+    def enqueue_sentinel(self) -> None:
+        # The stdlib uses put_nowait, which fails on a full queue. None
+        # is the sentinel the listener stops on.
+        self.queue.put(None)
+
+
+@dataclass(slots=True)
+class Segment:
+    name: str
+    start: float = 0.0
+    end: float = 0.0
+    size: int = 0
+    levels: dict[int, int] = field(default_factory=dict)
+
+    def add(self, created: float, levelno: int, size: int) -> None:
+        self.start = self.start or created
+        self.end = created
+        self.size += size
+        self.levels[levelno] = self.levels.get(levelno, 0) + 1
+
+    def matches(self, min_level: int, since: float | None, until: float | None) -> bool:
+        return (
+            any(levelno >= min_level for levelno in self.levels)
+            and (since is None or self.end >= since)
+            and (until is None or self.start <= until)
+        )
+
+
+def _read_segment(path: Path) -> t.Iterator[tuple[float, int, str]]:
+    # Each line is "created<TAB>levelno<TAB>json text", so filtering on
+    # time and level doesn't need the text decoded.
+    try:
+        with (
+            gzip.open(path, "rt", encoding="utf-8")
+            if path.suffix == ".gz"
+            else open(path, encoding="utf-8")
+        ) as f:
+            for line in f:
+                if not line.endswith("\n"):
+                    return
+
+                created, levelno, text = line.split("\t", 2)
+                yield float(created), int(levelno), text
+    except (EOFError, OSError, zlib.error):
+        # A segment cut short (or rotated away mid-read) still gave us
+        # everything before that point.
+        return
+
+
+def _compress(path: Path) -> Path:
+    target = path.with_suffix(".log.gz")
+
+    with open(path, "rb") as src, gzip.open(target, "wb") as dst:
+        shutil.copyfileobj(src, dst)
+
+    path.unlink()
+    return target
+
+
+class LogArchive(logging.Handler):
+    def __init__(
+        self,
+        path: Path,
+        segment_size: int = ARCHIVE_SEGMENT_SIZE,
+        segments: int = ARCHIVE_SEGMENTS,
+        level: int = logging.NOTSET,
+    ) -> None:
+        super().__init__(level)
+        self.path = path
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.segment_size = segment_size
+        self.max_segments = segments
+        self.segments = self._load_index()
+        self._open()
+
+    @property
+    def _index(self) -> Path:
+        return self.path / "index.json"
+
+    def _load_index(self) -> list[Segment]:
+        try:
+            data = json.loads(self._index.read_text())
+        except (OSError, ValueError):
+            data = []
+
+        segments = {
+            seg["name"]: Segment(
+                seg["name"],
+                seg["start"],
+                seg["end"],
+                seg["size"],
+                {int(k): v for k, v in seg["levels"].items()},
+            )
+            for seg in data
+            if (self.path / seg["name"]).is_file()
+        }
+
+        # A segment missing from the index was still being written when
+        # the bot last went down, so compress it and rebuild its entry.
+        for file in self.path.glob("*.log"):
+            _compress(file)
+
+        for file in self.path.glob("*.log.gz"):
+            if file.name not in segments:
+                segments[file.name] = seg = Segment(file.name)
+                for created, levelno, text in _read_segment(file):
+                    seg.add(created, levelno, len(text))
+
+        return [segments[name] for name in sorted(segments)]
+
+    def _save_index(self) -> None:
+        # The active segment is only indexed once it's closed, so after
+        # a crash it gets rebuilt from the file instead.
+        segments = self.segments if self.stream.closed else self.segments[:-1]
+        temp = self._index.with_suffix(".tmp")
+        temp.write_text(json.dumps([asdict(seg) for seg in segments]))
+        temp.replace(self._index)
+
+    def _open(self) -> None:
+        number = int(self.segments[-1].name.split(".")[0]) + 1 if self.segments else 0
+        self.active = Segment(f"{number:08}.log")
+        self.segments.append(self.active)
+        # The active segment is plain, line-buffered text, so every
+        # record is on disk as soon as it's written and a crash or kill
+        # loses nothing. It's compressed once it's full.
+        self.stream = open(
+            self.path / self.active.name, "a", encoding="utf-8", buffering=1
+        )
+
+    def _seal(self) -> None:
+        self.stream.close()
+        self.active.name = _compress(self.path / self.active.name).name
+
+    def _rotate(self) -> None:
+        self._seal()
+
+        while len(self.segments) >= self.max_segments:
+            (self.path / self.segments.pop(0).name).unlink(missing_ok=True)
+
+        self._save_index()
+        self._open()
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            text = json.dumps(self.format(record))
+            self.stream.write(f"{record.created:.6f}\t{record.levelno}\t{text}\n")
+            self.active.add(record.created, record.levelno, len(text))
+
+            if self.active.size >= self.segment_size:
+                self._rotate()
+        except Exception:
+            self.handleError(record)
+
+    def close(self) -> None:
+        self.acquire()
+        try:
+            if not self.stream.closed:
+                if self.active.levels:
+                    self._seal()
+                else:
+                    self.stream.close()
+                    (self.path / self.segments.pop().name).unlink(missing_ok=True)
+                self._save_index()
+        finally:
+            self.release()
+
+        super().close()
+
+    def query(
+        self,
+        min_level: int = logging.NOTSET,
+        since: float | None = None,
+        until: float | None = None,
+        limit: int = ARCHIVE_QUERY_LIMIT,
+    ) -> tuple[list[str], int, int]:
+        # This blocks on file I/O, so call it from a worker thread.
+        self.acquire()
+        try:
+            names = [
+                seg.name
+                for seg in self.segments
+                if seg.matches(min_level, since, until)
+            ]
+        finally:
+            self.release()
+
+        # Only the newest matches are kept if there are too many.
+        matches: collections.deque[str] = collections.deque(maxlen=limit)
+        total = 0
+
+        for name in names:
+            for created, levelno, text in _read_segment(self.path / name):
+                if until is not None and created > until:
+                    break
+
+                if levelno < min_level or (since is not None and created < since):
+                    continue
+
+                matches.append(json.loads(text))
+                total += 1
+
+        return list(matches), total, len(names)
@@ -29,7 +29,11 @@
 from __future__ import annotations
 
 import datetime as dt
+import hashlib
+import json
+import logging
 import re
+import time
 import typing as t
 
 from aiohttp import ClientSession
@@ -37,7 +41,13 @@ from aiohttp import ClientSession
 if t.TYPE_CHECKING:
     from hikari import User
 
+    from carberretta import Database
+
+log = logging.getLogger(__name__)
+
 ORDINAL_ENDINGS: t.Final = {"1": "st", "2": "nd", "3": "rd"}
+CODEBLOCK_PATTERN: t.Final = re.compile(r"```([a-z]*)(\n?)([\s\S]*?)\n?```")
+MYSTBIN_URL: t.Final = "https://api.mystb.in/paste"
 
 
 def list_of(items: list[str], sep: str = "and") -> str:
@@ -59,6 +69,21 @@ def possessive(user: User) -> str:
     return f"{name}'{'s' if not name.endswith('s') else ''}"
 
 
+async def _cached_paste(db: Database, digest: str, lifetime: float) -> str | None:
+    row = await db.try_fetch_record(
+        "SELECT paste_id, expires_at, hits FROM pastes WHERE digest = ?", digest
+    )
+
+    # Only hand out an existing paste if it'll stay up for a good part
+    # of the time asked for; otherwise upload a fresh one.
+    if not row or row.expires_at - time.time() < lifetime / 2:
+        return None
+
+    await db.execute("UPDATE pastes SET hits = hits + 1 WHERE digest = ?", digest)
+    log.info(f"Reusing paste {row.paste_id} ({row.hits + 1:,} hit(s))")
+    return t.cast(str, row.paste_id)
+
+
 async def binify(
     session: ClientSession,
     text: str,
@@ -67,31 +92,80 @@ async def binify(
     only_codeblocks: bool = False,
     expires_in_days: int = 7,
     file_extension: str = "",
+    attachments: t.Sequence[tuple[str, str]] = (),
+    db: Database | None = None,
 ) -> str:
-    async def convert(body: str, to_replace: str, ext: str) -> str:
+    blocks: list[tuple[str, str]] = []
+    parts = [text]
+
+    if not only_codeblocks:
+        blocks.append((file_extension, text))
+    else:
+        # One pass over the text: the code goes into the paste and the
+        # text around it is kept to be joined back up with the link.
+        parts = []
+        end = 0
+
+        for match in CODEBLOCK_PATTERN.finditer(text):
+            if not match.group(2):
+                code, ext = match.group(1) + match.group(3), file_extension
+            else:
+                code = match.group(3) or match.group(1) or "None"
+                ext = f".{match.group(1)}" if match.group(1) else file_extension
+
+            blocks.append((ext, code))
+            parts.append(text[end : match.start()])
+            end = match.end()
+
+        parts.append(text[end:])
+
+    files = [
+        {
+            "filename": f"{filename}-{i}{ext}" if len(blocks) > 1 else filename + ext,
+            "content": body,
+        }
+        for i, (ext, body) in enumerate(blocks, start=1)
+    ]
+    files.extend({"filename": name, "content": body} for name, body in attachments)
+
+    if not files:
+        return text
+
+    # Identical content maps to the same paste, so repeats of the same
+    # error or log excerpt don't get uploaded again.
+    digest = hashlib.sha256(json.dumps(files).encode()).hexdigest()
+    lifetime = expires_in_days * 86400
+
+    if not db or not (paste_id := await _cached_paste(db, digest, lifetime)):
+        # Everything goes up as one multi-file paste in one request.
         payload = {
-            "files": [{"filename": f"{filename}{ext}", "content": body}],
+            "files": files,
             "expires": str(dt.datetime.now() + dt.timedelta(expires_in_days)),
         }
 
-        async with session.put("https://api.mystb.in/paste", json=payload) as resp:
+        async with session.put(MYSTBIN_URL, json=payload) as resp:
             if not resp.ok:
                 return f"Failed calling Mystbin. HTTP status code: {resp.status}"
 
-            data = await resp.json()
-            return text.replace(to_replace, f"<https://mystb.in/{data['id']}>")
+            paste_id = (await resp.json())["id"]
 
-    if not only_codeblocks:
-        return await convert(text, text, file_extension)
+        if db:
+            now = time.time()
+            await db.execute("DELETE FROM pastes WHERE expires_at < ?", now)
+            await db.execute(
+                "INSERT OR REPLACE INTO pastes VALUES (?, ?, ?, ?, 0)",
+                digest,
+                paste_id,
+                now,
+                now + lifetime,
+            )
 
-    while (match := re.search(r"```([a-z]*)(\n?)([\s\S]*?)\n?```", text)) is not None:
-        if not match.group(2):
-            code = match.group(1) + match.group(3)
-        else:
-            code = match.group(3) or match.group(1) or "None"
-            if match.group(1):
-                file_extension = f".{match.group(1)}"
+    link = f"<https://mystb.in/{paste_id}>"
+    if not only_codeblocks:
+        return link
 
-        text = await convert(code, match.group(0), file_extension)
+    text = link.join(parts)
+    if attachments:
+        text += f"\n\n{len(attachments):,} attachment(s): {link}"
 
     return text
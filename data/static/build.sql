@@ -11,3 +11,61 @@ CREATE TABLE IF NOT EXISTS errors (
     err_cmd TEXT,
     err_text TEXT
 );
+
+CREATE TABLE IF NOT EXISTS rtfm_queries (
+    source TEXT,
+    query TEXT,
+    queries INTEGER DEFAULT 0,
+    selections INTEGER DEFAULT 0,
+    PRIMARY KEY (source, query)
+);
+
+CREATE TABLE IF NOT EXISTS youtube_videos (
+    video_id TEXT PRIMARY KEY,
+    title TEXT,
+    position INTEGER,
+    synced_at INTEGER
+);
+
+CREATE TABLE IF NOT EXISTS youtube_playlists (
+    playlist_id TEXT PRIMARY KEY,
+    title TEXT,
+    position INTEGER,
+    synced_at INTEGER
+);
+
+CREATE TABLE IF NOT EXISTS youtube_quota (
+    day TEXT,
+    endpoint TEXT,
+    units INTEGER DEFAULT 0,
+    PRIMARY KEY (day, endpoint)
+);
+
+CREATE TABLE IF NOT EXISTS gateway_members (
+    member_id INTEGER PRIMARY KEY,
+    joined_at REAL,
+    pending INTEGER DEFAULT 1
+);
+
+CREATE TABLE IF NOT EXISTS gateway_heartbeat (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    seen_at REAL
+);
+
+CREATE TABLE IF NOT EXISTS unhoist_queue (
+    guild_id INTEGER,
+    member_id INTEGER PRIMARY KEY
+);
+
+CREATE TABLE IF NOT EXISTS pastes (
+    digest TEXT PRIMARY KEY,
+    paste_id TEXT,
+    created_at REAL,
+    expires_at REAL,
+    hits INTEGER DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS youtube_feed_seen (
+    video_id TEXT PRIMARY KEY,
+    seen_at REAL
+);
@@ -39,6 +39,7 @@ PROJECT_NAME: t.Final = Path(__file__).parent.stem.lower()
 CHECK_PATHS: t.Final = (
     str(PROJECT_DIR / PROJECT_NAME),
     str(PROJECT_DIR / "noxfile.py"),
+    str(PROJECT_DIR / "benchmarks"),
 )
 
 
@@ -141,6 +142,17 @@ def security(session: nox.Session) -> None:
     session.run("bandit", "-qr", CHECK_PATHS[0], "-s", "B101")
 
 
+@nox.session(reuse_venv=True)
+def benchmarks(session: nox.Session) -> None:
+    session.install("-r", "requirements.txt")
+    # `nox -s benchmarks -- logs` picks a suite; RTFM is the default.
+    suite, args = "rtfm", session.posargs
+    if args and (PROJECT_DIR / "benchmarks" / f"{args[0]}.py").is_file():
+        suite, *args = args
+
+    session.run("python", "-m", f"benchmarks.{suite}", *args)
+
+
 @nox.session(reuse_venv=True)
 def dependencies(session: nox.Session) -> None:
     session.install(*fetch_installs("Dependencies"))